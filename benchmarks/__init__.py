@@ -0,0 +1 @@
+# 離線效能測試：合成 TWSE / 行情資料，量測各熱點路徑並與基準值比較（python -m benchmarks）
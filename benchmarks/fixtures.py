@@ -0,0 +1,138 @@
+import json
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from stock_tracker.config import MARKET_TZ
+from stock_tracker.providers import MarketDataProvider, quotes_from_bars, synthetic_bars
+
+# 合成資料使用的公司名稱用字、產業別與非股票分類（解析時應略過）
+NAME_CHARS = '台積電聯發鴻海中華國泰富邦玉山元大統一長榮陽明華航大立光和碩廣達仁寶緯創友達群創南亞塑化遠東新光開發永豐兆豐第一合作彰銀'
+INDUSTRIES = ['水泥工業', '食品工業', '塑膠工業', '紡織纖維', '電機機械', '半導體業', '電腦及週邊設備業', '光電業', '金融保險業', '航運業']
+OTHER_CATEGORIES = ['上市認購(售)權證', 'ETN', '臺灣存託憑證(TDR)']
+
+# 合成 ISIN 頁面（與 TWSE strMode=2 相同的表格結構），回傳 (html, 股票清單)
+def isin_page(stocks=1000, others=200, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    rows = []
+    expected = []
+    for i in range(stocks):
+        code = str(1101 + i)
+        name = ''.join(rng.sample(NAME_CHARS, rng.randint(2, 4)))
+        while name in names:
+            name = ''.join(rng.sample(NAME_CHARS, rng.randint(2, 4)))
+        names.add(name)
+        stock = {
+            'code': code,
+            'name': name,
+            'isin': f"TW000{code.zfill(4)}00{i % 10}",
+            'date_listed': f"{rng.randint(1962, 2023)}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}",
+            'market': '上市',
+            'industry': rng.choice(INDUSTRIES),
+            'cficode': 'ESVUFR',
+            'category': '股票',
+            'suffix': '.TW',
+        }
+        expected.append(stock)
+        rows.append(_isin_row(stock))
+    html = ['<html><head><meta charset="big5"></head><body>', '<table class="h4">',
+            '<tr><td>有價證券代號及名稱 </td><td>國際證券辨識號碼(ISIN Code)</td><td>上市日</td>'
+            '<td>市場別</td><td>產業別</td><td>CFICode</td><td>備註</td></tr>',
+            '<tr><td colspan=7><b> 股票 <b> </td></tr>']
+    html.extend(rows)
+    for category in OTHER_CATEGORIES:
+        html.append(f'<tr><td colspan=7><b> {category} <b> </td></tr>')
+        for i in range(others // len(OTHER_CATEGORIES)):
+            html.append(_isin_row({
+                'code': f"{700000 + i}", 'name': f"{category}{i}", 'isin': f"TW{i:010d}",
+                'date_listed': '2024/01/01', 'market': '上市', 'industry': '', 'cficode': 'RWSCCE',
+            }))
+    html.append('</table></body></html>')
+    return '\n'.join(html), expected
+
+def _isin_row(stock):
+    return (f'<tr><td bgcolor=#FAFAD2>{stock["code"]}　{stock["name"]}</td>'
+            f'<td bgcolor=#FAFAD2>{stock["isin"]}</td><td bgcolor=#FAFAD2>{stock["date_listed"]}</td>'
+            f'<td bgcolor=#FAFAD2>{stock["market"]}</td><td bgcolor=#FAFAD2>{stock["industry"]}</td>'
+            f'<td bgcolor=#FAFAD2>{stock["cficode"]}</td><td bgcolor=#FAFAD2></td></tr>')
+
+# N 檔股票的合成 K 線：{interval: {symbol: K 線}}
+def market_bars(symbols, intraday_bars=270 * 5, daily_bars=250, end='2024-10-01 13:29'):
+    return {
+        '1m': {symbol: synthetic_bars(symbol, '1m', end, intraday_bars) for symbol in symbols},
+        '1d': {symbol: synthetic_bars(symbol, '1d', end, daily_bars) for symbol in symbols},
+    }
+
+# 合成全市場日 K 線（所有股票的隨機漫步一次產生），回傳 (symbol, ts, open, high, low, close, volume) 資料列
+def market_daily_rows(symbols, days=250, end='2024-10-01', seed=0):
+    rng = np.random.default_rng(seed)
+    ts = pd.bdate_range(end=end, periods=days).tz_localize(MARKET_TZ).asi8 // 10**9
+    shape = (days, len(symbols))
+    close = rng.uniform(10, 1000, len(symbols)) * np.exp(np.cumsum(rng.normal(0, 0.015, shape), axis=0))
+    open_ = np.vstack([close[:1], close[:-1]])
+    spread = 1 + np.abs(rng.normal(0, 0.015, shape))
+    columns = [
+        np.repeat(np.asarray(symbols, dtype=object)[None, :], days, axis=0),
+        np.repeat(ts[:, None], len(symbols), axis=1),
+        open_.round(2),
+        (np.maximum(open_, close) * spread).round(2),
+        (np.minimum(open_, close) / spread).round(2),
+        close.round(2),
+        rng.integers(1_000, 500_000, shape),
+    ]
+    return list(zip(*(column.ravel().tolist() for column in columns)))
+
+# 合成 TWSE 每日收盤行情檔案（MI_INDEX JSON 格式，一個交易日一個檔案），回傳檔案數
+def snapshot_files(directory, symbols, days=250, end='2024-10-01', seed=0):
+    fields = ['證券代號', '證券名稱', '成交股數', '開盤價', '最高價', '最低價', '收盤價']
+    rows = market_daily_rows(symbols, days, end, seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(days):
+        day = rows[i * len(symbols):(i + 1) * len(symbols)]
+        date = pd.Timestamp(day[0][1], unit='s', tz=MARKET_TZ)
+        data = [[symbol[:-3], symbol[:-3], f"{volume:,}", f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:,.2f}"]
+                for symbol, _, o, h, l, c, volume in day]
+        with open(os.path.join(directory, f"MI_INDEX_{date:%Y%m%d}.json"), 'w', encoding='utf-8') as f:
+            json.dump({'stat': 'OK', 'date': f"{date:%Y%m%d}", 'tables': [{'fields': fields, 'data': data}]}, f, ensure_ascii=False)
+    return days
+
+# 合成投資組合：持股與每檔 history 筆購買紀錄，回傳 (portfolio 資料列, purchase_history 資料列)；
+# 持股數量與成本由 purchase_history 的觸發器維護，portfolio 資料列只有代號與名稱
+def portfolio_rows(symbols, history=10, seed=0):
+    rng = random.Random(seed)
+    portfolio = []
+    purchases = []
+    for symbol in symbols:
+        quantities = [rng.randint(1, 20) * 1000 for _ in range(history)]
+        portfolio.append((symbol, symbol))
+        for quantity in quantities:
+            date = f"2024-{rng.randint(1, 9):02d}-{rng.randint(1, 28):02d} 10:00:00"
+            purchases.append((symbol, date, round(rng.uniform(20, 800), 2), quantity))
+    return portfolio, purchases
+
+# 記憶體內的資料來源（不讀檔、不連網，只量測估值本身）
+class FixtureProvider(MarketDataProvider):
+    name = 'fixture'
+
+    def __init__(self, bars_by_interval):
+        self.bars_by_interval = bars_by_interval
+
+    def bars(self, symbols, interval, start=None):
+        frames = self.bars_by_interval.get(interval, {})
+        result = {}
+        for symbol in symbols:
+            if symbol in frames:
+                data = frames[symbol]
+                result[symbol] = data if start is None else data[data.index >= start]
+        return result
+
+    def quotes(self, symbols):
+        return quotes_from_bars({symbol: data.iloc[-1:] for symbol, data in self.intraday_bars(symbols).items()})
+
+    def metadata(self, symbol):
+        daily = self.bars_by_interval['1d'].get(symbol, pd.DataFrame())
+        return {'longName': symbol, 'regularMarketPreviousClose': float(daily['Close'].iloc[-2]) if len(daily) > 1 else None}
+
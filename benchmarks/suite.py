@@ -0,0 +1,392 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from stock_tracker.bars import load_from_database, read_bars, save_bars, save_to_database
+from stock_tracker.config import DEFAULT_INDICATORS, ISIN_CHUNK_SIZE, ISIN_ENCODING, ISIN_MODES
+from stock_tracker.db import get_database, init_database
+from stock_tracker.indicators import IndicatorEngine, IndicatorSeries, reference_indicators
+from stock_tracker.portfolio import load_portfolio, load_portfolio_history, save_portfolio_changes, update_portfolio_history
+from stock_tracker.resolver import StockResolver, fuzzy_search_name, get_resolver
+from stock_tracker.screener import compute_screen, load_panel, screen
+from stock_tracker.snapshots import ingest_snapshots
+from stock_tracker.stock_list import decode_chunks, load_stock_list, parse_stock_list, refresh_stock_list
+
+from .fixtures import FixtureProvider, isin_page, market_bars, market_daily_rows, portfolio_rows, snapshot_files
+
+# 預設的基準值檔案、存檔的測試頁面目錄與允許的退步比例
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+DEFAULT_TOLERANCE = 0.75
+# 每個計時樣本的最短秒數（很快的函式在一個樣本內連續執行多次，降低計時誤差）
+MIN_SAMPLE_SECONDS = 0.05
+
+# 效能測試項目：名稱 → 建立函式；建立函式在計時外準備資料，回傳 (計時的函式, 每次處理的項目數)。
+# io_bound 的項目以 SQLite / 檔案存取為主，不以純 Python 的校正工作量換算速度
+BENCHMARKS = {}
+IO_BOUND = set()
+
+def benchmark(name, io_bound=False):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        if io_bound:
+            IO_BOUND.add(name)
+        return factory
+    return register
+
+# 所有測試共用的合成資料與已填入資料的資料庫
+class Context:
+    def __init__(self, args):
+        self.args = args
+        self.directory = tempfile.mkdtemp(prefix='stock-bench-')
+        self.db_path = os.path.join(self.directory, 'bench.db')
+        # 每次執行都建立新資料庫的測試共用的檔名序號（重新量測時不會沿用先前的檔案）
+        self.counter = itertools.count()
+        self.html, self.stocks = isin_page(args.stocks)
+        self.symbols = [f"{stock['code']}.TW" for stock in self.stocks[:args.symbols]]
+        self.bars = market_bars(self.symbols, args.intraday_bars, args.daily_bars)
+        init_database(self.db_path)
+        refresh_stock_list(self.db_path, force=True, fetch=lambda: self.stocks)
+        save_bars(self.db_path, self.bars['1m'], '1m')
+        save_bars(self.db_path, self.bars['1d'], '1d')
+        holdings = [f"{stock['code']}.TW" for stock in self.stocks[:args.portfolio]]
+        self.portfolio_bars = market_bars(holdings, 1, 2)
+        portfolio, purchases = portfolio_rows(holdings, args.history)
+        with get_database(self.db_path).transaction() as conn:
+            conn.executemany("INSERT INTO portfolio (symbol, name) VALUES (?, ?)", portfolio)
+            conn.executemany('''
+                INSERT INTO purchase_history (symbol, purchase_date, purchase_price, quantity) VALUES (?, ?, ?, ?)
+            ''', purchases)
+
+    def close(self):
+        get_database(self.db_path).close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+@benchmark('parse_stock_list')
+def bench_parse_stock_list(ctx):
+    return lambda: parse_stock_list(ctx.html), len(ctx.stocks)
+
+# 與下載時相同的路徑：Big5 位元組分段解碼後逐列解析
+@benchmark('parse_stock_list_stream')
+def bench_parse_stock_list_stream(ctx):
+    data = ctx.html.encode(ISIN_ENCODING)
+    chunks = [data[i:i + ISIN_CHUNK_SIZE] for i in range(0, len(data), ISIN_CHUNK_SIZE)]
+    return lambda: parse_stock_list(decode_chunks(chunks)), len(ctx.stocks)
+
+# 存檔的 TWSE 上市 / 上櫃 ISIN 頁面（fixtures/isin）
+@benchmark('parse_isin_fixtures')
+def bench_parse_isin_fixtures(ctx):
+    pages = {}
+    for mode in ISIN_MODES:
+        with open(os.path.join(FIXTURES_DIR, 'isin', f"C_public_{mode}.html"), 'rb') as f:
+            pages[mode] = f.read()
+    rows = sum(len(parse_stock_list(decode_chunks([data]), mode)) for mode, data in pages.items())
+    return lambda: [parse_stock_list(decode_chunks([data]), mode) for mode, data in pages.items()], rows
+
+@benchmark('init_database', io_bound=True)
+def bench_init_database(ctx):
+    return lambda: init_database(os.path.join(ctx.directory, f"init-{next(ctx.counter)}.db")), 1
+
+@benchmark('load_stock_list', io_bound=True)
+def bench_load_stock_list(ctx):
+    return lambda: load_stock_list(ctx.db_path), len(ctx.stocks)
+
+@benchmark('build_resolver')
+def bench_build_resolver(ctx):
+    rows = [(stock['code'], stock['name'], stock['isin'], stock['suffix']) for stock in ctx.stocks]
+    return lambda: StockResolver(rows), len(rows)
+
+@benchmark('fuzzy_search_name', io_bound=True)
+def bench_fuzzy_search_name(ctx):
+    rng = random.Random(1)
+    # 名稱刪去或替換一個字，模擬打錯字的查詢
+    queries = []
+    for stock in rng.sample(ctx.stocks, 100):
+        name = list(stock['name'])
+        name[rng.randrange(len(name))] = rng.choice('股份有限公司')
+        queries.append(''.join(name))
+    get_resolver(ctx.db_path)
+    return lambda: [fuzzy_search_name(query, ctx.db_path) for query in queries], len(queries)
+
+@benchmark('save_to_database', io_bound=True)
+def bench_save_to_database(ctx):
+    rows = sum(len(data) for data in ctx.bars['1m'].values())
+    return lambda: [save_to_database(ctx.db_path, symbol, data) for symbol, data in ctx.bars['1m'].items()], rows
+
+@benchmark('load_from_database', io_bound=True)
+def bench_load_from_database(ctx):
+    return lambda: [load_from_database(ctx.db_path, symbol) for symbol in ctx.symbols], len(ctx.symbols)
+
+@benchmark('read_bars_range', io_bound=True)
+def bench_read_bars_range(ctx):
+    rows = sum(len(data) for data in ctx.bars['1m'].values())
+    return lambda: [read_bars(ctx.db_path, symbol, '1m', columns=['Close']) for symbol in ctx.symbols], rows
+
+@benchmark('load_portfolio', io_bound=True)
+def bench_load_portfolio(ctx):
+    provider = FixtureProvider(ctx.portfolio_bars)
+    return lambda: load_portfolio(ctx.db_path, provider), ctx.args.portfolio
+
+# 表格編輯：修改一檔持股的數量只寫入一筆調整紀錄（觸發器更新持股），與投資組合大小無關
+@benchmark('save_portfolio_edit', io_bound=True)
+def bench_save_portfolio_edit(ctx):
+    portfolio = load_portfolio(ctx.db_path, FixtureProvider(ctx.portfolio_bars))
+    quantities = itertools.cycle([1000, 2000])
+    return lambda: save_portfolio_changes(ctx.db_path, portfolio, {'edited_rows': {0: {'quantity': next(quantities)}}}), 1
+
+# 投資組合歷史：--portfolio 檔持股的購買紀錄與 --daily-bars 天的日 K 線另存一個資料庫（兩個測試共用）
+def history_db(ctx):
+    db_path = os.path.join(ctx.directory, 'history.db')
+    if not os.path.exists(db_path):
+        init_database(db_path)
+        holdings = [f"{stock['code']}.TW" for stock in ctx.stocks[:ctx.args.portfolio]]
+        portfolio, purchases = portfolio_rows(holdings, ctx.args.history)
+        with get_database(db_path).transaction() as conn:
+            conn.executemany('''
+                INSERT INTO stock_data (symbol, interval, ts, open, high, low, close, volume) VALUES (?, '1d', ?, ?, ?, ?, ?, ?)
+            ''', market_daily_rows(holdings, ctx.args.daily_bars))
+            conn.executemany("INSERT INTO portfolio (symbol, name) VALUES (?, ?)", portfolio)
+            conn.executemany('''
+                INSERT INTO purchase_history (symbol, purchase_date, purchase_price, quantity) VALUES (?, ?, ?, ?)
+            ''', purchases)
+    return db_path
+
+# 從頭計算整段歷史（交易日 × 持股的陣列運算與寫入）
+@benchmark('portfolio_history_rebuild', io_bound=True)
+def bench_portfolio_history_rebuild(ctx):
+    db_path = history_db(ctx)
+    days = update_portfolio_history(db_path, rebuild=True)
+    return lambda: update_portfolio_history(db_path, rebuild=True), days * ctx.args.portfolio
+
+# 圖表讀取：增量更新（只重算最後一天）後以主鍵範圍讀取整段每日合計
+@benchmark('portfolio_history_daily', io_bound=True)
+def bench_portfolio_history_daily(ctx):
+    db_path = history_db(ctx)
+    days = update_portfolio_history(db_path, rebuild=True)
+    return lambda: load_portfolio_history(db_path), days
+
+# 串流指標：從頭計算全部日 K 線（不含資料庫）
+@benchmark('indicators_full')
+def bench_indicators_full(ctx):
+    closes = {symbol: (data.index.asi8 // 10**9, data['Close'].to_numpy(dtype=float)) for symbol, data in ctx.bars['1d'].items()}
+    rows = sum(len(close) for _, close in closes.values())
+
+    def run():
+        for ts, close in closes.values():
+            series = IndicatorSeries(DEFAULT_INDICATORS)
+            for t, c in zip(ts.tolist(), close.tolist()):
+                series.commit(t, c)
+    return run, rows
+
+# 串流指標：每次輪詢只推進最後一根 K 線（狀態已在記憶體中）
+@benchmark('indicators_incremental')
+def bench_indicators_incremental(ctx):
+    engine = IndicatorEngine()
+    for symbol, data in ctx.bars['1d'].items():
+        engine.advance(ctx.db_path, symbol, '1d', data)
+    return lambda: [engine.advance(ctx.db_path, symbol, '1d', data) for symbol, data in ctx.bars['1d'].items()], len(ctx.symbols)
+
+# 對照組：以 ta 整批計算相同指標
+@benchmark('indicators_ta')
+def bench_indicators_ta(ctx):
+    rows = sum(len(data) for data in ctx.bars['1d'].values())
+    return lambda: [reference_indicators(data['Close'], DEFAULT_INDICATORS) for data in ctx.bars['1d'].values()], rows
+
+# 選股器：股票清單中所有股票（--stocks 檔 × --daily-bars 天）的日 K 線另存一個資料庫，
+# 量測未快取時讀取二維陣列並計算全市場指標的時間
+@benchmark('screen_market', io_bound=True)
+def bench_screen_market(ctx):
+    db_path = os.path.join(ctx.directory, 'screen.db')
+    symbols = [f"{stock['code']}.TW" for stock in ctx.stocks]
+    if not os.path.exists(db_path):
+        init_database(db_path)
+        refresh_stock_list(db_path, force=True, fetch=lambda: ctx.stocks)
+        with get_database(db_path).transaction() as conn:
+            conn.executemany('''
+                INSERT INTO stock_data (symbol, interval, ts, open, high, low, close, volume) VALUES (?, '1d', ?, ?, ?, ?, ?, ?)
+            ''', market_daily_rows(symbols, ctx.args.daily_bars))
+    screen(db_path)
+    return lambda: compute_screen(load_panel(db_path)), len(symbols)
+
+# 每日收盤行情匯入：每次匯入 5 個交易日的全市場檔案（--stocks 檔）到新的資料庫
+@benchmark('ingest_snapshots', io_bound=True)
+def bench_ingest_snapshots(ctx):
+    directory = os.path.join(ctx.directory, 'snapshots')
+    days = snapshot_files(directory, [f"{stock['code']}.TW" for stock in ctx.stocks], 5)
+    return lambda: ingest_snapshots(os.path.join(ctx.directory, f"ingest-{next(ctx.counter)}.db"), directory), days * len(ctx.stocks)
+
+# 執行單一測試：先暖身一次，再計時 repeat 個樣本；另外以 tracemalloc 執行一次量測記憶體高峰
+def measure(run, items, repeat):
+    started = time.perf_counter()
+    run()
+    number = max(1, math.ceil(MIN_SAMPLE_SECONDS / max(time.perf_counter() - started, 1e-6)))
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            run()
+        latencies.append((time.perf_counter() - started) / number)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies = np.array(latencies) * 1000
+    return {
+        'items': items,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'throughput': float(items / latencies.mean() * 1000),
+        'peak_mb': peak / 2**20,
+    }
+
+# 校正用的固定工作量（純 Python 排序與字典操作），用來抵銷不同機器或 CPU 負載造成的速度差異；
+# 每輪量測 repeat 次取中位數，main 在各測試之間各執行一輪，再取所有輪的中位數
+def calibrate(repeat=3):
+    rng = random.Random(0)
+    values = [rng.random() for _ in range(200_000)]
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sorted(values)
+        {i: value for i, value in enumerate(values)}
+        latencies.append(time.perf_counter() - started)
+    return float(np.median(latencies) * 1000)
+
+# 與基準值比較：p50 延遲或記憶體高峰超過基準值 (1 + tolerance) 倍視為退步；
+# CPU 為主的項目依校正工作量換算成本機速度，io_bound 的項目直接比較。回傳 {名稱: [退步說明]}
+def compare(results, baseline, tolerance, speed=1.0):
+    regressions = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        expected = base['p50_ms'] * (1.0 if name in IO_BOUND else speed)
+        result['vs_baseline'] = result['p50_ms'] / expected if expected else None
+        if result['p50_ms'] > expected * (1 + tolerance):
+            adjusted = '' if name in IO_BOUND else ' (speed-adjusted)'
+            regressions.setdefault(name, []).append(
+                f"{name}: p50 {result['p50_ms']:.2f} ms vs baseline {expected:.2f} ms{adjusted}")
+        if result['peak_mb'] > base['peak_mb'] * (1 + tolerance) and result['peak_mb'] - base['peak_mb'] > 1:
+            regressions.setdefault(name, []).append(f"{name}: peak {result['peak_mb']:.1f} MiB vs baseline {base['peak_mb']:.1f} MiB")
+    return regressions
+
+# 換算基準值到不同速度的機器（延遲乘以 scale，吞吐量除以 scale）；io_bound 的項目不換算
+def rescale(name, result, scale):
+    if name in IO_BOUND:
+        return result
+    return {
+        **result,
+        **{key: result[key] * scale for key in ('p50_ms', 'p95_ms', 'p99_ms')},
+        'throughput': result['throughput'] / scale,
+    }
+
+def report(results):
+    print(f"{'benchmark':<24}{'items':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>12}{'peak MiB':>10}{'vs base':>9}")
+    for name, result in results.items():
+        ratio = f"{result['vs_baseline']:.2f}x" if result.get('vs_baseline') else '-'
+        print(f"{name:<24}{result['items']:>8}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+              f"{result['throughput']:>12,.0f}{result['peak_mb']:>10.1f}{ratio:>9}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Offline benchmarks for the stock tracker hot paths")
+    parser.add_argument('--stocks', type=int, default=1000, help="listed stocks in the synthetic ISIN page")
+    parser.add_argument('--symbols', type=int, default=20, help="symbols with generated bars")
+    parser.add_argument('--intraday-bars', type=int, default=270 * 5, help="1-minute bars per symbol")
+    parser.add_argument('--daily-bars', type=int, default=250, help="daily bars per symbol")
+    parser.add_argument('--portfolio', type=int, default=100, help="portfolio positions")
+    parser.add_argument('--history', type=int, default=10, help="purchase records per position")
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument('--update-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown before failing (0.75 = 75%%)")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    return parser
+
+# 基準值只在相同的測試參數下比較
+def fixture_params(args):
+    return {key: getattr(args, key) for key in ('stocks', 'symbols', 'intraday_bars', 'daily_bars', 'portfolio', 'history')}
+
+# 讀取相同測試參數下的基準值（回傳 (各項結果, 校正時間)；沒有可比較的基準值時為 ({}, None)）
+def load_baseline(path, params):
+    if not os.path.exists(path):
+        return {}, None
+    with open(path, encoding='utf-8') as f:
+        stored = json.load(f)
+    if stored.get('params') != params:
+        print("Baseline was recorded with different fixture parameters; skipping comparison", file=sys.stderr)
+        return {}, None
+    return stored['results'], stored['calibration_ms']
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    baseline, baseline_calibration = load_baseline(args.baseline, fixture_params(args))
+    ctx = Context(args)
+    try:
+        results = {}
+        calibrations = []
+        for name in args.only or BENCHMARKS:
+            calibrations.append(calibrate())
+            run, items = BENCHMARKS[name](ctx)
+            results[name] = measure(run, items, args.repeat)
+        calibrations.append(calibrate())
+        calibration_ms = float(np.median(calibrations))
+        speed = calibration_ms / baseline_calibration if baseline_calibration else 1.0
+        regressions = compare(results, baseline, args.tolerance, speed)
+        # 退步的項目重新量測一次，兩次都退步才算（排除單次的系統負載波動）
+        if regressions and not args.update_baseline:
+            print(f"Re-running {len(regressions)} regressed benchmarks to confirm", file=sys.stderr)
+            retried = {}
+            for name in regressions:
+                run, items = BENCHMARKS[name](ctx)
+                retried[name] = measure(run, items, args.repeat)
+            confirmed = compare(retried, baseline, args.tolerance, speed)
+            for name in regressions:
+                if name not in confirmed:
+                    print(f"not reproduced: {'; '.join(regressions[name])}", file=sys.stderr)
+            results.update(retried)
+            regressions = confirmed
+    finally:
+        ctx.close()
+    report(results)
+    print(f"calibration {calibration_ms:.1f} ms ({speed:.2f}x baseline machine time)")
+    output = {
+        'params': fixture_params(args),
+        'python': platform.python_version(),
+        'calibration_ms': calibration_ms,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+    if args.update_baseline:
+        # 只更新部分項目時，保留其他項目的基準值（CPU 為主的項目依校正工作量換算到本次的速度）
+        if baseline and args.only:
+            scale = calibration_ms / baseline_calibration
+            kept = {name: rescale(name, result, scale) for name, result in baseline.items()}
+            output['results'] = {**kept, **results}
+        # vs_baseline 只屬於本次比較，不寫入基準值
+        output['results'] = {
+            name: {key: value for key, value in result.items() if key != 'vs_baseline'}
+            for name, result in output['results'].items()
+        }
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    for messages in regressions.values():
+        for regression in messages:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
@@ -0,0 +1,2 @@
+# 台股追蹤核心套件：資料庫、股票清單、K 線同步與歸檔、行情資料來源、指標、投資組合與警示；
+# 不依賴 Streamlit，可由 app.py 或命令列（python -m stock_tracker）使用
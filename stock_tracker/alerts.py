@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .config import ALERT_DEFAULT_HYSTERESIS, ALERT_KINDS, ALERT_LABELS
+from .db import get_database, init_database
+from .metrics import timed
+from .resources import cached_resource, logger
+
+# 警示規則觀察的指標欄位（window 代入 SMA / RSI 的天數）
+def alert_metric(kind, window):
+    metric, _ = ALERT_KINDS[kind]
+    return metric.format(window=int(window)) if '{window}' in metric else metric
+
+# 由快照整理各股票的警示指標：現價、漲跌幅、與各 SMA 的乖離率（%）、RSI
+def alert_metrics(snapshots):
+    rows = {}
+    for symbol, snapshot in snapshots.items():
+        if snapshot['intraday'].empty:
+            continue
+        price = float(snapshot['intraday']['Close'].iloc[-1])
+        previous_close = snapshot['info'].get('regularMarketPreviousClose')
+        row = {
+            'price': price,
+            'pct_change': (price / previous_close - 1) * 100 if previous_close else np.nan,
+        }
+        latest = snapshot['indicators'].iloc[-1] if not snapshot['indicators'].empty else {}
+        for column, value in dict(latest).items():
+            if column.startswith('sma_'):
+                row[f"{column}_gap"] = (price / value - 1) * 100 if value else np.nan
+            elif column.startswith('rsi_'):
+                row[column] = value
+        rows[symbol] = row
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+# 警示引擎：所有啟用中的規則常駐記憶體，每批新報價以陣列運算一次評估；
+# 觸發後需回到門檻另一側超過 hysteresis 才重新啟動，避免每次輪詢重複觸發
+class AlertEngine:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._rules = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+
+    def _load(self):
+        rules = get_database(self.db_path).query_df('''
+            SELECT id, symbol, kind, threshold, window, hysteresis, armed FROM alerts WHERE active = 1
+        ''')
+        rules['metric'] = [alert_metric(kind, window) for kind, window in zip(rules['kind'], rules['window'])]
+        rules['direction'] = rules['kind'].map(lambda kind: ALERT_KINDS[kind][1]).astype(float)
+        # 價格規則的 hysteresis 為門檻的百分比，其餘為指標本身的單位
+        rules['band'] = np.where(rules['metric'] == 'price', rules['threshold'].abs() * rules['hysteresis'] / 100, rules['hysteresis'])
+        rules['armed'] = rules['armed'].astype(bool)
+        return rules
+
+    def rules(self):
+        with self._lock:
+            if self._rules is None:
+                self._rules = self._load()
+            return self._rules
+
+    def symbols(self):
+        return set(self.rules()['symbol'])
+
+    # 評估一批報價（metrics 的 index 為 symbol），回傳本次觸發的警示
+    @timed('alerts.evaluate')
+    def evaluate(self, metrics, ts=None):
+        ts = int(time.time()) if ts is None else ts
+        rules = self.rules()
+        with self._lock:
+            selected = np.flatnonzero(rules['symbol'].isin(metrics.index).to_numpy())
+            if not len(selected) or metrics.empty:
+                return pd.DataFrame(columns=['alert_id', 'symbol', 'kind', 'threshold', 'value'])
+            subset = rules.iloc[selected]
+            row_idx = metrics.index.get_indexer(subset['symbol'])
+            col_idx = metrics.columns.get_indexer(subset['metric'])
+            found = col_idx >= 0
+            values = np.full(len(subset), np.nan)
+            values[found] = metrics.to_numpy(dtype=float)[row_idx[found], col_idx[found]]
+            distance = subset['direction'].to_numpy() * (values - subset['threshold'].to_numpy())
+            armed = subset['armed'].to_numpy()
+            fire = armed & (distance >= 0)
+            rearm = ~armed & (distance < -subset['band'].to_numpy())
+            changed = fire | rearm
+            if not changed.any():
+                return pd.DataFrame(columns=['alert_id', 'symbol', 'kind', 'threshold', 'value'])
+            armed_column = rules.columns.get_loc('armed')
+            rules.iloc[selected[changed], armed_column] = rearm[changed]
+            triggered = pd.DataFrame({
+                'alert_id': subset['id'].to_numpy()[fire],
+                'symbol': subset['symbol'].to_numpy()[fire],
+                'kind': subset['kind'].to_numpy()[fire],
+                'threshold': subset['threshold'].to_numpy()[fire],
+                'value': values[fire],
+            })
+            with get_database(self.db_path).transaction() as conn:
+                conn.executemany("UPDATE alerts SET armed = ? WHERE id = ?", zip(
+                    rearm[changed].astype(int).tolist(), subset['id'].to_numpy()[changed].tolist()))
+                conn.executemany('''
+                    INSERT INTO alert_triggers (alert_id, symbol, ts, value, message) VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (int(row.alert_id), row.symbol, ts, float(row.value), alert_message(row.symbol, row.kind, row.threshold, row.value))
+                    for row in triggered.itertuples(index=False)
+                ])
+            return triggered
+
+@cached_resource
+def get_alert_engine(db_path):
+    return AlertEngine(db_path)
+
+def alert_message(symbol, kind, threshold, value):
+    return f"{symbol} {ALERT_LABELS[kind]} {threshold:g} (now {value:.2f})"
+
+# 有啟用中的規則時，讓背景輪詢以 provider 持續評估此資料庫的規則（不需要有 session 在看）
+def watch_alerts(db_path, provider):
+    from .poller import get_poller
+    if get_alert_engine(db_path).symbols():
+        get_poller().watch_alerts(db_path, provider)
+
+# 新增 / 停用警示規則（指定 provider 時立即開始背景輪詢）
+def add_alert(db_path, symbol, kind, threshold, window=None, hysteresis=ALERT_DEFAULT_HYSTERESIS, provider=None):
+    try:
+        init_database(db_path)
+        with get_database(db_path).transaction() as conn:
+            conn.execute('''
+                INSERT INTO alerts (symbol, kind, threshold, window, hysteresis, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (symbol, kind, threshold, window, hysteresis, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        get_alert_engine(db_path).invalidate()
+        if provider is not None:
+            watch_alerts(db_path, provider)
+    except Exception as e:
+        logger.error(f"Failed to add alert: {str(e)}")
+
+def remove_alert(db_path, alert_id):
+    try:
+        with get_database(db_path).transaction() as conn:
+            conn.execute("UPDATE alerts SET active = 0 WHERE id = ?", (alert_id,))
+        get_alert_engine(db_path).invalidate()
+    except Exception as e:
+        logger.error(f"Failed to remove alert: {str(e)}")
+
+# 讀取某檔股票的啟用規則與最近的觸發紀錄
+def load_alerts(db_path, symbol):
+    return get_database(db_path).query_df('''
+        SELECT id, kind, threshold, window, hysteresis, armed FROM alerts WHERE symbol = ? AND active = 1 ORDER BY id
+    ''', (symbol,))
+
+def recent_alert_triggers(db_path, symbol, since):
+    return get_database(db_path).query_df('''
+        SELECT ts, message FROM alert_triggers WHERE symbol = ? AND ts >= ? ORDER BY ts DESC
+    ''', (symbol, since))
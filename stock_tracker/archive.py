@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from .config import ARCHIVE_COMPRESSION, ARCHIVE_DIR_SUFFIX, ARCHIVE_SCHEMA, BAR_INTERVALS, MARKET_TZ
+from .db import get_database, get_metadata, init_database, set_metadata
+from .metrics import metrics, timed
+from .resources import cached_resource
+
+# 冷資料歸檔目錄（與資料庫檔案放在同一目錄）：<目錄>/<週期>/<symbol>/<YYYY-MM>.parquet
+def archive_dir(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + ARCHIVE_DIR_SUFFIX
+
+def archive_path(db_path, symbol, interval, month):
+    return os.path.join(archive_dir(db_path), interval, symbol, f"{month}.parquet")
+
+def archive_months(db_path, symbol, interval):
+    directory = os.path.join(archive_dir(db_path), interval, symbol)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len('.parquet')] for name in os.listdir(directory) if name.endswith('.parquet'))
+
+# UTC epoch 秒轉為台股時區的月份字串（YYYY-MM）
+def month_keys(ts):
+    local = pd.DatetimeIndex(pd.to_datetime(ts, unit='s', utc=True)).tz_convert(MARKET_TZ).tz_localize(None)
+    return np.datetime_as_string(local.to_numpy().astype('datetime64[M]'))
+
+# 寫入單一月份的歸檔檔案（與既有檔案合併，先寫暫存檔再替換，讀取端不會看到寫到一半的檔案）
+def write_archive_month(path, frame):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if os.path.exists(path):
+        frame = pd.concat([pq.read_table(path).to_pandas(), frame])
+        frame = frame.drop_duplicates('ts', keep='last').sort_values('ts')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(frame, schema=pa.schema(ARCHIVE_SCHEMA), preserve_index=False)
+    pq.write_table(table, path + '.tmp', compression=ARCHIVE_COMPRESSION)
+    os.replace(path + '.tmp', path)
+
+# 歸檔作業鎖（同一程序內只允許一個歸檔作業）
+@cached_resource
+def _archive_lock():
+    return threading.Lock()
+
+# 將已收盤且超過保留天數的 K 線從 stock_data 移到 Parquet 歸檔，回傳搬移的筆數；
+# 每檔股票在單一交易內完成讀取、寫檔與刪除，同步寫入會等待而不會遺失資料
+@timed('archive.compact')
+def compact_bars(db_path, now=None):
+    init_database(db_path)
+    db = get_database(db_path)
+    today = pd.Timestamp(now if now is not None else time.time(), unit='s', tz='UTC').tz_convert(MARKET_TZ).normalize()
+    moved = 0
+    with _archive_lock():
+        for interval, spec in BAR_INTERVALS.items():
+            if spec['archive_after_days'] is None:
+                continue
+            cutoff = int((today - pd.Timedelta(days=spec['archive_after_days'])).timestamp())
+            symbols = [row[0] for row in db.query(
+                "SELECT DISTINCT symbol FROM stock_data WHERE interval = ? AND ts < ?", (interval, cutoff))]
+            for symbol in symbols:
+                with db.transaction() as conn:
+                    df = pd.read_sql_query('''
+                        SELECT ts, open, high, low, close, volume FROM stock_data
+                        WHERE symbol = ? AND interval = ? AND ts < ? ORDER BY ts
+                    ''', conn, params=(symbol, interval, cutoff))
+                    for month, part in df.groupby(month_keys(df['ts'].to_numpy())):
+                        write_archive_month(archive_path(db_path, symbol, interval, month), part)
+                    conn.execute("DELETE FROM stock_data WHERE symbol = ? AND interval = ? AND ts < ?", (symbol, interval, cutoff))
+                moved += len(df)
+                metrics.count('rows_archived', len(df))
+        if moved:
+            with db.connection() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                # 搬走的資料超過一半頁數時才 VACUUM 縮小資料庫檔案
+                if free_pages * 2 > conn.execute("PRAGMA page_count").fetchone()[0]:
+                    conn.execute("VACUUM")
+    return moved
+
+# 每個交易日最多執行一次歸檔（由背景輪詢呼叫）
+def compact_if_due(db_path, now=None):
+    db = get_database(db_path)
+    today = pd.Timestamp(now if now is not None else time.time(), unit='s', tz='UTC').tz_convert(MARKET_TZ).strftime('%Y-%m-%d')
+    with db.connection() as conn:
+        if get_metadata(conn, 'archive_compacted_on') == today:
+            return 0
+    moved = compact_bars(db_path, now)
+    with db.transaction() as conn:
+        set_metadata(conn, 'archive_compacted_on', today)
+    return moved
+
+# 讀取歸檔中的 K 線：只開啟區間涵蓋的月份檔案，只讀取需要的欄位，並以 memory map 開檔
+def _read_archive(db_path, symbol, interval, start, end, fields, limit):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    months = archive_months(db_path, symbol, interval)
+    if start is not None:
+        months = [month for month in months if month >= month_keys([start])[0]]
+    if end is not None:
+        months = [month for month in months if month <= month_keys([end])[0]]
+    filters = []
+    if start is not None:
+        filters.append(('ts', '>=', start))
+    if end is not None:
+        filters.append(('ts', '<', end))
+    tables = []
+    rows = 0
+    # 有筆數上限時由最新的月份往回讀，足夠即停止
+    for month in reversed(months):
+        table = pq.read_table(archive_path(db_path, symbol, interval, month), columns=fields,
+                              filters=filters or None, memory_map=True)
+        tables.append(table)
+        rows += table.num_rows
+        if limit is not None and rows >= limit:
+            break
+    if not tables:
+        return pd.DataFrame(columns=fields)
+    return pa.concat_tables(tables[::-1]).to_pandas(split_blocks=True)
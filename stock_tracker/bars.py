@@ -0,0 +1,247 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from .archive import _read_archive
+from .config import BAR_COLUMNS, BAR_INTERVALS, MARKET_TZ
+from .db import bump_daily_bars_version, get_database, init_database, mark_portfolio_history_dirty
+from .metrics import metrics, timed
+from .resources import cached_resource, logger
+
+# 整理 K 線資料：只保留 OHLCV 欄位、去除無收盤價的列、時間索引統一為台股時區
+def normalize_bars(data):
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.droplevel(1, axis=1)
+    data = data[BAR_COLUMNS].dropna(subset=['Close'])
+    index = pd.DatetimeIndex(data.index)
+    index = index.tz_localize(MARKET_TZ) if index.tz is None else index.tz_convert(MARKET_TZ)
+    return data.set_axis(index, axis=0)
+
+# 將 K 線資料轉為 stock_data 資料列（時間轉為 UTC epoch 秒）
+def bars_to_rows(symbol, data, interval='1m'):
+    data = normalize_bars(data)
+    ts = data.index.asi8 // 10**9
+    return list(zip(
+        [symbol] * len(data),
+        [interval] * len(data),
+        ts.tolist(),
+        data['Open'].to_numpy(dtype=float).tolist(),
+        data['High'].to_numpy(dtype=float).tolist(),
+        data['Low'].to_numpy(dtype=float).tolist(),
+        data['Close'].to_numpy(dtype=float).tolist(),
+        data['Volume'].fillna(0).to_numpy(dtype='int64').tolist(),
+    ))
+
+# stock_data 資料列轉回 K 線資料（與 yfinance 相同的欄位與索引）
+def rows_to_bars(df, columns=BAR_COLUMNS):
+    index = pd.to_datetime(df['ts'], unit='s', utc=True).dt.tz_convert(MARKET_TZ)
+    bars = df[[column.lower() for column in columns]].set_axis(columns, axis=1)
+    return bars.set_axis(pd.DatetimeIndex(index), axis=0)
+
+# 儲存多檔股票的 K 線到資料庫（單一交易）；日 K 線寫入投資組合中（含已賣出）的股票時，
+# 投資組合歷史從最早寫入的交易日起重算（例如補抓過去的收盤價或新增持股後才同步歷史）
+def save_bars(db_path, bars_by_symbol, interval='1m'):
+    rows = []
+    for symbol, data in bars_by_symbol.items():
+        rows.extend(bars_to_rows(symbol, data, interval))
+    with get_database(db_path).transaction() as conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO stock_data (symbol, interval, ts, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        if interval == '1d' and rows:
+            bump_daily_bars_version(conn)
+            held = {row[0] for row in conn.execute("SELECT DISTINCT symbol FROM purchase_history WHERE symbol IS NOT NULL")}
+            earliest = min((row[2] for row in rows if row[0] in held), default=None)
+            if earliest is not None:
+                mark_portfolio_history_dirty(conn, pd.Timestamp(earliest, unit='s', tz='UTC').tz_convert(MARKET_TZ).strftime('%Y-%m-%d'))
+    metrics.count('rows_written', len(rows), table='stock_data')
+    return len(rows)
+
+# 儲存股票價格到資料庫
+def save_to_database(db_path, symbol, data, interval='1m'):
+    try:
+        init_database(db_path)
+        return save_bars(db_path, {symbol: data}, interval)
+    except Exception as e:
+        logger.error(f"Failed to save data to database: {str(e)}")
+        return 0
+
+# 從資料庫讀取股票價格（含已歸檔的 K 線）
+def load_from_database(db_path, symbol, interval='1m', limit=100):
+    try:
+        init_database(db_path)
+        bars = read_bars(db_path, symbol, interval, limit=limit).iloc[::-1]
+        df = bars.set_axis([column.lower() for column in BAR_COLUMNS], axis=1).reset_index(drop=True)
+        df.insert(0, 'symbol', symbol)
+        df.insert(1, 'date', bars.index.strftime('%Y-%m-%d %H:%M:%S'))
+        df.insert(2, 'ts', bars.index.asi8 // 10**9)
+        return df
+    except Exception as e:
+        logger.error(f"Failed to load data from database: {str(e)}")
+        return pd.DataFrame()
+
+def to_epoch(value):
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    value = pd.Timestamp(value)
+    value = value.tz_localize(MARKET_TZ) if value.tz is None else value
+    return int(value.timestamp())
+
+# 讀取時間區間 [start, end) 內的 K 線（合併歸檔與 stock_data，重疊時以 stock_data 為準）；
+# columns 為 BAR_COLUMNS 的子集，limit 只保留最後幾根
+@timed('bars.read')
+def read_bars(db_path, symbol, interval, start=None, end=None, columns=None, limit=None):
+    columns = columns or BAR_COLUMNS
+    fields = ['ts'] + [column.lower() for column in columns]
+    start, end = to_epoch(start), to_epoch(end)
+    conditions = ["symbol = ?", "interval = ?"]
+    params = [symbol, interval]
+    if start is not None:
+        conditions.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("ts < ?")
+        params.append(end)
+    sql = f"SELECT {', '.join(fields)} FROM stock_data WHERE {' AND '.join(conditions)} ORDER BY ts DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    hot = get_database(db_path).query_df(sql, tuple(params)).iloc[::-1]
+    if limit is None or len(hot) < limit:
+        if not hot.empty:
+            end = int(hot['ts'].iloc[0]) if end is None else min(end, int(hot['ts'].iloc[0]))
+        cold = _read_archive(db_path, symbol, interval, start, end, fields,
+                             None if limit is None else limit - len(hot))
+        if not cold.empty:
+            hot = cold if hot.empty else pd.concat([cold, hot], ignore_index=True)
+    if limit is not None:
+        hot = hot.iloc[-limit:]
+    return rows_to_bars(hot, columns)
+# 找出 K 線序列中第一個缺口的起點（同一交易時段內間隔超過 max_gap 秒）
+def find_gap_start(ts, interval):
+    spec = BAR_INTERVALS[interval]
+    diffs = np.diff(ts)
+    gaps = np.flatnonzero((diffs > spec['max_gap']) & (diffs < spec['session_break']))
+    return int(ts[gaps[0]]) if len(gaps) else None
+
+# 程序內共用的 K 線記憶體快取（各 session 共用，每個 symbol / 週期各有一把鎖）
+class BarStore:
+    def __init__(self):
+        self.frames = {}
+        self.verified_until = {}
+        self.backfilled = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    # 資料庫由其他途徑大量寫入後（如匯入每日收盤行情），丟棄該週期的記憶體 K 線，下次同步時重新載入
+    def invalidate(self, db_path, interval):
+        with self._guard:
+            for key in [key for key in self.frames if key[0] == db_path and key[2] == interval]:
+                self.frames.pop(key, None)
+                self.verified_until.pop(key, None)
+
+@cached_resource
+def get_bar_store():
+    return BarStore()
+
+# 從資料庫載入最近的 K 線（記憶體快取冷啟動時使用）
+def load_bars(db_path, symbol, interval, limit):
+    return read_bars(db_path, symbol, interval, limit=limit)
+
+# 計算同步起點：最後一根 K 線，或尚未確認過的區段中第一個缺口；None 表示抓取預設區間
+def _sync_start(store, key, frame, max_lookback):
+    if frame.empty:
+        return None
+    ts = frame.index.asi8 // 10**9
+    verified = store.verified_until.get(key)
+    # 只檢查尚未向資料來源確認過的區段是否有缺口
+    unchecked = ts if verified is None else ts[ts >= verified]
+    gap_start = find_gap_start(unchecked, key[2])
+    start = int(ts[-1]) if gap_start is None else gap_start
+    if max_lookback is None:
+        return start
+    oldest = int(time.time()) - max_lookback
+    if start < oldest:
+        return None if ts[-1] < oldest else oldest
+    return start
+
+# 增量同步多檔股票的 K 線：只向資料來源要求最後一根已存 K 線之後（或第一個缺口之後）的資料，
+# 一次批次抓取、單一交易寫入資料庫並合併到記憶體快取，回傳 {symbol: 合併後的 K 線}；
+# history 為至少需要的歷史秒數（例如選股器需要一年的日 K 線），不足時從該起點回補一次
+@timed('bars.sync')
+def sync_many(db_path, symbols, interval, provider, history=None):
+    init_database(db_path)
+    spec = BAR_INTERVALS[interval]
+    store = get_bar_store()
+    symbols = sorted(set(symbols))
+    locks = [store.lock_for((db_path, symbol, interval)) for symbol in symbols]
+    for lock in locks:
+        lock.acquire()
+    try:
+        frames = {}
+        starts = {}
+        for symbol in symbols:
+            key = (db_path, symbol, interval)
+            frame = store.frames.get(key)
+            if frame is None:
+                frame = load_bars(db_path, symbol, interval, spec['window'])
+            frames[symbol] = frame
+            starts[symbol] = _sync_start(store, key, frame, provider.max_lookback.get(interval))
+        backfill = []
+        if history is not None:
+            history_start = int(time.time()) - history
+            covered = history_start + spec['max_gap']
+            for symbol in symbols:
+                key = (db_path, symbol, interval)
+                frame = frames[symbol]
+                # 上市未滿 history 的股票回補一次後就不再重複要求
+                if (frame.empty or frame.index.asi8[0] // 10**9 > covered) and store.backfilled.get(key, float('inf')) > covered:
+                    backfill.append(symbol)
+        # 新股票抓取預設區間；其餘合併為一次批次，使用最早的起點（重複的 K 線由主鍵去除）
+        cold = [symbol for symbol in symbols if starts[symbol] is None and symbol not in backfill]
+        warm = [symbol for symbol in symbols if starts[symbol] is not None and symbol not in backfill]
+        fetched = {}
+        if backfill:
+            fetched.update(provider.bars(backfill, interval, pd.Timestamp(history_start, unit='s', tz='UTC')))
+            for symbol in backfill:
+                store.backfilled[(db_path, symbol, interval)] = history_start
+            # 區間內沒有資料（例如停止交易或較舊的重播資料）時改抓預設區間
+            cold += [symbol for symbol in backfill if symbol not in fetched and starts[symbol] is None]
+        if cold:
+            fetched.update(provider.bars(cold, interval))
+        if warm:
+            start = pd.Timestamp(min(starts[symbol] for symbol in warm), unit='s', tz='UTC')
+            fetched.update(provider.bars(warm, interval, start))
+        if fetched:
+            save_bars(db_path, fetched, interval)
+        for symbol in symbols:
+            key = (db_path, symbol, interval)
+            frame = frames[symbol]
+            if symbol in fetched:
+                frame = pd.concat([frame, fetched[symbol]]) if not frame.empty else fetched[symbol]
+                frame = frame[~frame.index.duplicated(keep='last')].sort_index().iloc[-spec['window']:]
+            if not frame.empty:
+                store.verified_until[key] = int(frame.index.asi8[-1] // 10**9)
+            store.frames[key] = frame
+            frames[symbol] = frame
+        return frames
+    finally:
+        for lock in locks:
+            lock.release()
+
+# 增量同步單檔股票的 K 線
+def sync_bars(db_path, symbol, interval, provider):
+    return sync_many(db_path, [symbol], interval, provider)[symbol]
+
+# 只保留最後一個交易日的 K 線（盤中圖表使用）
+def latest_session(data):
+    if data.empty:
+        return data
+    return data[data.index.normalize() == data.index[-1].normalize()]
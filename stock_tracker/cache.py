@@ -0,0 +1,197 @@
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+import pandas as pd
+
+from .config import CACHE_MAX_ENTRIES, CACHE_PERSIST_KINDS, MARKET_TZ
+from .db import get_database, init_database
+from .metrics import metrics
+from .providers import MarketDataProvider, ReplayProvider, YFinanceProvider
+from .resources import cached_resource
+
+# 距離下一個交易時段開盤（台灣時間 09:00）的秒數，作為昨收價的存活時間
+def seconds_until_next_session(now=None):
+    now = pd.Timestamp.now(tz=MARKET_TZ) if now is None else pd.Timestamp(now, unit='s', tz='UTC').tz_convert(MARKET_TZ)
+    next_open = now.normalize() + pd.Timedelta(hours=9)
+    if next_open <= now:
+        next_open += pd.Timedelta(days=1)
+    return (next_open - now).total_seconds()
+
+# 快取各資料類別的存活時間（秒，或依目前時間計算秒數的函式）
+CACHE_TTLS = {
+    'metadata': 24 * 60 * 60,
+    'previous_close': lambda now: seconds_until_next_session(now),
+    'quote': 5,
+}
+
+# 程序內共用的 TTL / LRU 快取：各資料類別有各自的存活時間，超過上限時淘汰最久未使用的項目；
+# 同一鍵同時未命中只會抓取一次，其餘呼叫等待同一結果；persist_kinds 內的類別同時寫入 SQLite
+class TTLCache:
+    def __init__(self, ttls=CACHE_TTLS, max_entries=CACHE_MAX_ENTRIES, db_path=None, persist_kinds=CACHE_PERSIST_KINDS):
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.persist_kinds = set(persist_kinds) if db_path else set()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.coalesced = Counter()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _expires_at(self, kind, now):
+        ttl = self.ttls[kind]
+        return now + (ttl(now) if callable(ttl) else ttl)
+
+    def _store(self, kind, key, value, expires_at):
+        self._entries[(kind, key)] = (expires_at, value)
+        self._entries.move_to_end((kind, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # None（例如查詢失敗）不寫入快取，與 get_many 相同
+    def put(self, kind, key, value):
+        if value is None:
+            return
+        expires_at = self._expires_at(kind, time.time())
+        with self._lock:
+            self._store(kind, key, value, expires_at)
+        if kind in self.persist_kinds:
+            self._persist(kind, {key: value}, expires_at)
+
+    def _load_persisted(self, kind, keys, now):
+        if kind not in self.persist_kinds or not keys:
+            return {}
+        rows = get_database(self.db_path).query(f'''
+            SELECT key, value, expires_at FROM cache_entries
+            WHERE kind = ? AND expires_at > ? AND key IN ({','.join('?' * len(keys))})
+        ''', (kind, now, *keys))
+        return {key: (json.loads(value), expires_at) for key, value, expires_at in rows}
+
+    def _persist(self, kind, values, expires_at):
+        with get_database(self.db_path).transaction() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO cache_entries (kind, key, value, expires_at) VALUES (?, ?, ?, ?)
+            ''', [(kind, key, json.dumps(value), expires_at) for key, value in values.items()])
+
+    # 批次讀取：loader 只會收到本次呼叫負責抓取的鍵，回傳 {key: value}（缺少的鍵視為 None）；
+    # None 不寫入快取，下次讀取（例如逐檔重試）會再向 loader 抓取
+    def get_many(self, kind, keys, loader):
+        now = time.time()
+        result = {}
+        owned = {}
+        waiting = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((kind, key))
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end((kind, key))
+                    self.hits[kind] += 1
+                    result[key] = entry[1]
+                elif (kind, key) in self._inflight:
+                    self.coalesced[kind] += 1
+                    waiting[key] = self._inflight[(kind, key)]
+                else:
+                    self.misses[kind] += 1
+                    owned[key] = self._inflight[(kind, key)] = Future()
+        if metrics.enabled:
+            metrics.count('cache_requests', len(result), kind=kind, result='hit')
+            metrics.count('cache_requests', len(waiting), kind=kind, result='coalesced')
+            metrics.count('cache_requests', len(owned), kind=kind, result='miss')
+        if owned:
+            try:
+                loaded = {}
+                for key, (value, expires_at) in self._load_persisted(kind, list(owned), now).items():
+                    loaded[key] = value
+                    with self._lock:
+                        self._store(kind, key, value, expires_at)
+                missing = [key for key in owned if key not in loaded]
+                if missing:
+                    fetched = loader(missing)
+                    expires_at = self._expires_at(kind, time.time())
+                    values = {key: fetched[key] for key in missing if fetched.get(key) is not None}
+                    with self._lock:
+                        for key, value in values.items():
+                            self._store(kind, key, value, expires_at)
+                    if kind in self.persist_kinds and values:
+                        self._persist(kind, values, expires_at)
+                    loaded.update({key: values.get(key) for key in missing})
+                for key, future in owned.items():
+                    future.set_result(loaded[key])
+                result.update(loaded)
+            except Exception as e:
+                for future in owned.values():
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop((kind, key), None)
+        for key, future in waiting.items():
+            result[key] = future.result()
+        return result
+
+    def get(self, kind, key, loader):
+        return self.get_many(kind, [key], lambda keys: {key: loader()})[key]
+
+    def invalidate(self, kind=None):
+        with self._lock:
+            for cache_key in [k for k in self._entries if kind is None or k[0] == kind]:
+                del self._entries[cache_key]
+
+    def stats(self):
+        kinds = sorted(set(self.ttls) | set(self.hits) | set(self.misses))
+        with self._lock:
+            sizes = Counter(kind for kind, _ in self._entries)
+        return pd.DataFrame({
+            'hits': [self.hits[kind] for kind in kinds],
+            'misses': [self.misses[kind] for kind in kinds],
+            'coalesced': [self.coalesced[kind] for kind in kinds],
+            'entries': [sizes[kind] for kind in kinds],
+        }, index=pd.Index(kinds, name='kind'))
+
+# 加上快取的資料來源：基本資料每日、昨收價每個交易時段、報價數秒更新一次；K 線由增量同步處理不經快取
+class CachedProvider(MarketDataProvider):
+    def __init__(self, inner, cache):
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+        self.max_lookback = inner.max_lookback
+
+    def bars(self, symbols, interval, start=None):
+        return self.inner.bars(symbols, interval, start)
+
+    def quotes(self, symbols):
+        def load(missing):
+            quotes = self.inner.quotes(missing)
+            return {symbol: row for symbol, row in zip(quotes.index, quotes.to_dict('records'))}
+        cached = self.cache.get_many('quote', list(symbols), load)
+        rows = {symbol: row for symbol, row in cached.items() if row is not None}
+        return pd.DataFrame.from_dict(rows, orient='index', columns=['price', 'volume', 'ts']).rename_axis('symbol')
+
+    def _load_metadata(self, symbol):
+        info = self.inner.metadata(symbol)
+        self.cache.put('previous_close', symbol, info.get('regularMarketPreviousClose'))
+        return {field: value for field, value in info.items() if field != 'regularMarketPreviousClose'}
+
+    def metadata(self, symbol):
+        info = dict(self.cache.get('metadata', symbol, lambda: self._load_metadata(symbol)))
+        previous_close = self.cache.get('previous_close', symbol, lambda: self.inner.metadata(symbol).get('regularMarketPreviousClose'))
+        if previous_close is not None:
+            info['regularMarketPreviousClose'] = previous_close
+        return info
+
+    def stock_list(self):
+        return self.inner.stock_list()
+
+# 行情資料來源（指定重播目錄時改用本機資料，不需網路），外層加上共用快取並寫入該資料庫
+@cached_resource
+def get_provider(replay_dir=None, db_path=None):
+    inner = ReplayProvider(replay_dir) if replay_dir else YFinanceProvider()
+    if db_path:
+        init_database(db_path)
+    return CachedProvider(inner, TTLCache(db_path=db_path))
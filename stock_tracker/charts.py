@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from .bars import read_bars
+from .config import CHART_CACHE_ENTRIES, CHART_MAX_POINTS, CHART_RANGES, CHART_TIMEFRAMES, DEFAULT_INDICATORS, MARKET_TZ
+from .metrics import timed
+from .resources import cached_resource
+
+# 將 K 線彙總為較長週期（rule 為 pandas 頻率字串，None 表示不彙總）
+def resample_bars(bars, rule):
+    if rule is None or bars.empty:
+        return bars
+    resampled = bars.resample(rule, closed='left', label='left').agg({
+        'Open': 'first',
+        'High': 'max',
+        'Low': 'min',
+        'Close': 'last',
+        'Volume': 'sum',
+    })
+    return resampled.dropna(subset=['Close'])
+
+# Largest-Triangle-Three-Buckets 降採樣：回傳保留點的位置（保留首尾點與每個區間中最能代表曲線形狀的點）
+def lttb_indices(x, y, threshold):
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    counts = np.diff(edges)
+    # 每個區間的平均點（最後一個區間之後以最後一點作為下一區間）
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1])[:len(counts)] / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1])[:len(counts)] / counts, y[-1])
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+# 圖表快取的版本：最後一根 K 線的時間與 OHLCV（未收盤的 K 線時間不變但價量持續更新，也要重新計算）
+def chart_version(bars):
+    last = bars.iloc[-1]
+    return (int(bars.index.asi8[-1] // 10**9), *(float(last[column]) for column in ('Open', 'High', 'Low', 'Close', 'Volume')))
+
+# 圖表資料：由 K 線（含歸檔）彙總為指定週期，計算同週期的 SMA，點數超過上限時以 LTTB 降採樣；
+# version 見 chart_version，新 K 線進來或最後一根 K 線變動時才重新計算
+@cached_resource(max_entries=CHART_CACHE_ENTRIES)
+@timed('charts.series')
+def chart_series(db_path, symbol, timeframe, range_key, version):
+    source, rule = CHART_TIMEFRAMES[timeframe]
+    last = pd.Timestamp(version[0], unit='s', tz='UTC').tz_convert(MARKET_TZ)
+    start = last.normalize() - pd.Timedelta(days=CHART_RANGES[range_key] - 1)
+    candles = resample_bars(read_bars(db_path, symbol, source, start=start), rule)
+    for spec in DEFAULT_INDICATORS:
+        name, window = spec.split(':')
+        if name == 'sma':
+            candles[f"sma_{window}"] = candles['Close'].rolling(int(window)).mean()
+    if len(candles) <= CHART_MAX_POINTS:
+        return {'candles': candles, 'volume': candles['Volume'], 'downsampled': False, 'bars': len(candles)}
+    x = candles.index.asi8 // 10**9
+    price = candles.iloc[lttb_indices(x, candles['Close'].to_numpy(), CHART_MAX_POINTS)]
+    volume = candles['Volume'].iloc[lttb_indices(x, candles['Volume'].to_numpy(), CHART_MAX_POINTS)]
+    return {'candles': price, 'volume': volume, 'downsampled': True, 'bars': len(candles)}
@@ -0,0 +1,175 @@
+import argparse
+import logging
+import os
+import sys
+
+from .config import (
+    BAR_INTERVALS, METRICS_FILE_ENV, REPLAY_DIR_ENV, SCREENER_LIMIT, SCREENER_SORT_COLUMNS,
+    SNAPSHOT_DIR_ENV, SNAPSHOT_DIR_SUFFIX, STOCK_LIST_TTL,
+)
+from .metrics import metrics
+
+# 命令列工具（適合排程執行）：各指令只在執行時才載入需要的模組，啟動時不載入 pandas / yfinance
+
+# 更新股票清單
+def refresh_list(args):
+    from .cache import get_provider
+    from .stock_list import refresh_stock_list
+    provider = get_provider(args.replay_dir, args.db)
+    if refresh_stock_list(args.db, ttl=args.ttl * 60 * 60, force=args.force, fetch=provider.stock_list):
+        print("Stock list refreshed")
+    else:
+        print("Stock list is up to date (or the fetch failed; see errors above)")
+    return 0
+
+# 增量同步關注清單的 K 線
+def sync(args):
+    from .bars import sync_many
+    from .cache import get_provider
+    from .resolver import get_resolver
+    provider = get_provider(args.replay_dir, args.db)
+    resolver = get_resolver(args.db)
+    # 股票清單中沒有的代號直接視為上市股票（尚未更新股票清單時也能同步）；同名股票需改以代號指定
+    symbols = []
+    for query in args.symbols:
+        candidates = resolver.candidates(query)
+        if len(candidates) > 1:
+            print(f"{query} matches several stocks ({', '.join(candidates)}); specify the stock code", file=sys.stderr)
+            return 1
+        symbols.append(candidates[0] if candidates else (f"{query}.TW" if query.isdigit() else query.upper()))
+    for interval in args.interval or list(BAR_INTERVALS):
+        for symbol, bars in sync_many(args.db, symbols, interval, provider).items():
+            last = bars.index[-1].strftime('%Y-%m-%d %H:%M') if not bars.empty else '-'
+            print(f"{symbol} {interval}: {len(bars)} bars, last {last}")
+    return 0
+
+# 匯入 TWSE 每日收盤行情檔案（--download 時缺少的交易日先從 TWSE 下載）
+def ingest(args):
+    from .snapshots import ingest_snapshots, snapshot_dir
+    directory = args.dir or snapshot_dir(args.db)
+
+    def progress(done, total):
+        if done % 20 == 0 or done == total:
+            print(f"{done}/{total} days", file=sys.stderr)
+    result = ingest_snapshots(args.db, directory, args.start, args.end, args.download, progress)
+    print(f"Ingested {result['files']:,} files ({result['rows']:,} bars) from {directory}, "
+          f"{result['skipped']:,} already ingested")
+    if result['missing']:
+        print(f"No file for {len(result['missing']):,} days: {', '.join(result['missing'][:10])}"
+              f"{' ...' if len(result['missing']) > 10 else ''}", file=sys.stderr)
+    return 0
+
+# 全市場選股（--sync 先同步股票清單中所有股票的日 K 線）
+def screen_market(args):
+    from .screener import market_listing, screen, sync_market
+    if args.sync:
+        from .cache import get_provider
+        symbols = market_listing(args.db, args.industry, args.market).index.tolist()
+        synced = sync_market(args.db, get_provider(args.replay_dir, args.db), symbols,
+                             progress=lambda done, total: print(f"Synced {done}/{total} batches", file=sys.stderr))
+        print(f"Synced daily bars for {synced:,} of {len(symbols):,} stocks", file=sys.stderr)
+    screen_df = screen(args.db, args.industry, args.market, args.sort, args.ascending, args.limit)
+    if screen_df.empty:
+        print("No daily bars to screen (run with --sync after refresh-list)")
+        return 1
+    print(screen_df.to_string(index=False, float_format=lambda value: f"{value:,.2f}"))
+    return 0
+
+# 顯示投資組合損益
+def portfolio(args):
+    from .cache import get_provider
+    from .db import init_database
+    from .portfolio import value_portfolio
+    init_database(args.db)
+    portfolio_df = value_portfolio(args.db, get_provider(args.replay_dir, args.db))
+    if portfolio_df.empty:
+        print("No stocks in portfolio")
+        return 0
+    print(portfolio_df.to_string(index=False, float_format=lambda value: f"{value:,.2f}"))
+    print(f"Total cost: {portfolio_df['cost_basis'].sum():,.2f} TWD, "
+          f"profit/loss: {portfolio_df['profit_loss'].sum():,.2f} TWD")
+    if portfolio_df.attrs.get('missing_quotes'):
+        print(f"No quote for: {', '.join(portfolio_df.attrs['missing_quotes'])}", file=sys.stderr)
+        return 1
+    return 0
+
+# 顯示投資組合每日市值、成本與損益（--rebuild 從頭重新計算，例如補同步過去的日 K 線之後）
+def portfolio_history(args):
+    from .db import init_database
+    from .portfolio import load_portfolio_history, update_portfolio_history
+    init_database(args.db)
+    if args.rebuild:
+        print(f"Rebuilt {update_portfolio_history(args.db, rebuild=True):,} days of portfolio history", file=sys.stderr)
+    history = load_portfolio_history(args.db, args.start, args.end)
+    if history.empty:
+        print("No portfolio history (add purchases and sync daily bars first)")
+        return 0
+    print(history.to_string(float_format=lambda value: f"{value:,.2f}"))
+    return 0
+
+# 歸檔已收盤的 K 線
+def archive(args):
+    from .archive import archive_dir, compact_bars
+    print(f"Archived {compact_bars(args.db):,} bars to {archive_dir(args.db)}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m stock_tracker', description="Taiwan stock tracker command line tools")
+    parser.add_argument('--db', default='stock_data.db', help="database file path (default: stock_data.db)")
+    parser.add_argument('--replay-dir', default=os.environ.get(REPLAY_DIR_ENV) or None,
+                        help=f"offline replay directory instead of Yahoo Finance (default: ${REPLAY_DIR_ENV})")
+    parser.add_argument('--metrics-file', default=os.environ.get(METRICS_FILE_ENV) or None,
+                        help=f"write timings and counters here on exit (.prom or .jsonl, default: ${METRICS_FILE_ENV})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('refresh-list', help="refresh the TWSE stock list")
+    command.add_argument('--force', action='store_true', help="refresh even if the list is newer than the TTL")
+    command.add_argument('--ttl', type=float, default=STOCK_LIST_TTL / 60 / 60, help="refresh interval in hours")
+    command.set_defaults(func=refresh_list)
+
+    command = commands.add_parser('sync', help="sync bars for a watchlist")
+    command.add_argument('symbols', nargs='+', help="stock codes, Yahoo symbols, ISINs or names")
+    command.add_argument('--interval', action='append', choices=list(BAR_INTERVALS), help="bar interval (default: all)")
+    command.set_defaults(func=sync)
+
+    command = commands.add_parser('ingest', help="ingest TWSE daily all-market quote files (CSV / JSON)")
+    command.add_argument('--dir', default=os.environ.get(SNAPSHOT_DIR_ENV) or None,
+                         help=f"directory of daily files (default: ${SNAPSHOT_DIR_ENV} or <db>{SNAPSHOT_DIR_SUFFIX})")
+    command.add_argument('--start', help="first trading day (YYYY-MM-DD, default: all files in the directory)")
+    command.add_argument('--end', help="last trading day (YYYY-MM-DD, default: today when --start is given)")
+    command.add_argument('--download', action='store_true', help="download missing days from TWSE into the directory")
+    command.set_defaults(func=ingest)
+
+    command = commands.add_parser('screen', help="rank the whole market by returns, SMA gaps, RSI and volume")
+    command.add_argument('--industry', action='append', help="only this industry (repeatable)")
+    command.add_argument('--market', action='append', help="only this market (repeatable)")
+    command.add_argument('--sort', choices=SCREENER_SORT_COLUMNS, default=SCREENER_SORT_COLUMNS[0], help="sort column")
+    command.add_argument('--ascending', action='store_true', help="sort ascending instead of descending")
+    command.add_argument('--limit', type=int, default=SCREENER_LIMIT, help="number of rows to print")
+    command.add_argument('--sync', action='store_true', help="sync daily bars for the selected stocks first")
+    command.set_defaults(func=screen_market)
+
+    command = commands.add_parser('portfolio', help="print portfolio profit and loss")
+    command.set_defaults(func=portfolio)
+
+    command = commands.add_parser('portfolio-history', help="print daily portfolio value, cost and profit/loss")
+    command.add_argument('--start', help="first day (YYYY-MM-DD, default: first purchase)")
+    command.add_argument('--end', help="last day (YYYY-MM-DD, default: latest daily bar)")
+    command.add_argument('--rebuild', action='store_true', help="recompute the whole history instead of updating it")
+    command.set_defaults(func=portfolio_history)
+
+    command = commands.add_parser('archive', help="move closed bars to the Parquet archive")
+    command.set_defaults(func=archive)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+    if args.metrics_file:
+        metrics.enabled = True
+        metrics.export_path = args.metrics_file
+    try:
+        with metrics.span('cli.command', command=args.command):
+            return args.func(args)
+    finally:
+        metrics.export()
@@ -0,0 +1,134 @@
+# 設定值
+
+# SQLite 連線池大小、等待鎖的秒數、每條連線快取的 SQL 敘述數與連線參數
+SQLITE_POOL_SIZE = 8
+SQLITE_BUSY_TIMEOUT = 30
+SQLITE_STATEMENT_CACHE = 256
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -32000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+]
+# TWSE ISIN 股票清單：各 strMode 頁面（2 = 上市、4 = 上櫃）的 Yahoo 代號後綴、納入的分類與網頁編碼，
+# 以及串流下載與解析時每次讀取的位元組數
+ISIN_URL = 'https://isin.twse.com.tw/isin/C_public.jsp?strMode={mode}'
+ISIN_MODES = {
+    2: {'suffix': '.TW', 'categories': ('股票', 'ETF')},
+    4: {'suffix': '.TWO', 'categories': ('股票', 'ETF')},
+}
+ISIN_ENCODING = 'cp950'
+ISIN_CHUNK_SIZE = 64 * 1024
+# 股票清單更新間隔（秒）與抓取失敗後的重試間隔
+STOCK_LIST_TTL = 24 * 60 * 60
+STOCK_LIST_RETRY_INTERVAL = 5 * 60
+# 模糊查詢時由 n-gram 索引篩出的候選名稱數量上限
+FUZZY_SHORTLIST_SIZE = 10
+# 台股交易時區（stock_data 以 UTC epoch 秒儲存，顯示時轉回此時區）
+MARKET_TZ = 'Asia/Taipei'
+# yfinance 單次 yf.download 批次的股票數量上限
+YF_BATCH_SIZE = 50
+# 行情資料來源提供的股票基本資料欄位（yfinance info 欄位名稱）
+METADATA_FIELDS = ['longName', 'regularMarketPreviousClose', 'fiftyTwoWeekHigh', 'fiftyTwoWeekLow']
+# 離線重播資料目錄的環境變數
+REPLAY_DIR_ENV = 'STOCK_TRACKER_REPLAY_DIR'
+# 效能計測：啟用的環境變數與匯出檔案路徑的環境變數（.prom 為 Prometheus 文字格式，.jsonl 為 JSON lines）
+METRICS_ENV = 'STOCK_TRACKER_METRICS'
+METRICS_FILE_ENV = 'STOCK_TRACKER_METRICS_FILE'
+# 投資組合估值：同時查詢報價的執行緒數與每次查詢的逾時秒數
+QUOTE_WORKERS = 8
+QUOTE_TIMEOUT = 5
+# 投資清單表格欄位
+PORTFOLIO_COLUMNS = ["symbol", "name", "quantity", "current_price", "avg_purchase_price", "cost_basis", "profit_loss", "profit_loss_rate"]
+# 投資組合每日歷史欄位（成本、市值、損益）
+PORTFOLIO_HISTORY_COLUMNS = ["cost", "value", "profit_loss"]
+# 背景輪詢間隔（秒）與 session 逾時未更新關注清單後停止輪詢的秒數
+POLL_INTERVAL = 10
+POLL_SESSION_TTL = 60
+# 快取項目上限與寫入資料庫的類別（各類別存活時間見 cache.CACHE_TTLS）
+CACHE_MAX_ENTRIES = 5000
+CACHE_PERSIST_KINDS = ('metadata', 'previous_close')
+# 警示規則種類：觀察的指標欄位與方向（1 = 向上穿越門檻、-1 = 向下穿越門檻）
+ALERT_KINDS = {
+    'above': ('price', 1),
+    'below': ('price', -1),
+    'pct_up': ('pct_change', 1),
+    'pct_down': ('pct_change', -1),
+    'sma_cross_up': ('sma_{window}_gap', 1),
+    'sma_cross_down': ('sma_{window}_gap', -1),
+    'rsi_above': ('rsi_{window}', 1),
+    'rsi_below': ('rsi_{window}', -1),
+}
+ALERT_LABELS = {
+    'above': 'price above',
+    'below': 'price below',
+    'pct_up': 'change (%) above',
+    'pct_down': 'change (%) below',
+    'sma_cross_up': 'crossed above SMA, gap (%) ≥',
+    'sma_cross_down': 'crossed below SMA, gap (%) ≤',
+    'rsi_above': 'RSI above',
+    'rsi_below': 'RSI below',
+}
+# 警示重新啟動的緩衝（價格規則為門檻的 %，其餘為指標單位）與觸發訊息顯示的秒數
+ALERT_DEFAULT_HYSTERESIS = 0.5
+ALERT_DISPLAY_SECONDS = 10 * 60
+# 圖表使用的串流指標（規格字串見 INDICATOR_TYPES）與每組保留的指標值筆數
+DEFAULT_INDICATORS = ['sma:5', 'sma:20', 'rsi:14']
+INDICATOR_HISTORY = 300
+# 冷資料歸檔：目錄名稱後綴（與資料庫檔案同目錄）、Parquet 壓縮方式與欄位型別
+ARCHIVE_DIR_SUFFIX = '_archive'
+ARCHIVE_COMPRESSION = 'zstd'
+ARCHIVE_SCHEMA = [
+    ('ts', 'int64'),
+    ('open', 'float64'),
+    ('high', 'float64'),
+    ('low', 'float64'),
+    ('close', 'float64'),
+    ('volume', 'int64'),
+]
+# 圖表週期：資料來源的 K 線週期與彙總頻率（None 表示不彙總）
+CHART_TIMEFRAMES = {
+    '1m': ('1m', None),
+    '5m': ('1m', '5min'),
+    '15m': ('1m', '15min'),
+    '1h': ('1m', '1h'),
+    '1d': ('1d', None),
+    '1w': ('1d', 'W-MON'),
+}
+# 圖表範圍（天數，由最後一根 K 線的交易日往回算）、單一圖表的點數上限與快取的圖表數
+CHART_RANGES = {'1D': 1, '5D': 7, '1M': 31, '3M': 92, '6M': 183, '1Y': 366, '5Y': 1830}
+CHART_MAX_POINTS = 2000
+CHART_CACHE_ENTRIES = 64
+# TWSE 每日收盤行情（全部股票，一個交易日一個檔案）：下載網址、下載快取目錄名稱後綴（與資料庫檔案同目錄）、
+# 快取目錄的環境變數與兩次下載的間隔秒數（TWSE 會封鎖過於頻繁的請求）
+SNAPSHOT_URL = 'https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX?date={date}&type=ALLBUT0999&response=json'
+SNAPSHOT_DIR_SUFFIX = '_snapshots'
+SNAPSHOT_DIR_ENV = 'STOCK_TRACKER_SNAPSHOT_DIR'
+SNAPSHOT_DOWNLOAD_INTERVAL = 3
+# 每日收盤行情欄位（MI_INDEX 的中文欄位與 OpenAPI STOCK_DAY_ALL 的英文欄位）對應到 K 線欄位
+SNAPSHOT_FIELDS = {
+    '證券代號': 'code', '成交股數': 'Volume', '開盤價': 'Open', '最高價': 'High', '最低價': 'Low', '收盤價': 'Close',
+    'Code': 'code', 'TradeVolume': 'Volume', 'OpeningPrice': 'Open', 'HighestPrice': 'High', 'LowestPrice': 'Low', 'ClosingPrice': 'Close',
+}
+# 選股器：日 K 線的歷史天數、報酬率與均線的天數、RSI 與量比的天數、52 週高低點的交易日數與預設顯示筆數
+SCREENER_HISTORY_DAYS = 370
+SCREENER_RETURN_WINDOWS = [5, 20, 60, 252]
+SCREENER_SMA_WINDOWS = [20, 60]
+SCREENER_RSI_WINDOW = 14
+SCREENER_VOLUME_WINDOW = 20
+SCREENER_YEAR_BARS = 252
+SCREENER_LIMIT = 50
+# 選股器可排序的欄位（第一個為預設）
+SCREENER_SORT_COLUMNS = [
+    'return_20d', 'change_pct', 'return_5d', 'return_60d', 'return_252d', 'sma_20_gap', 'sma_60_gap',
+    'rsi_14', 'volume_ratio', 'from_high_pct', 'volume', 'close',
+]
+# K 線欄位（與 yfinance 相同）
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# 各 K 線週期設定：首次同步抓取區間、記憶體保留根數、視為缺口的間隔秒數、
+# 跨交易時段的間隔秒數（超過者不視為缺口）、在 stock_data 保留幾天後移到歸檔（None 表示不歸檔）
+BAR_INTERVALS = {
+    '1m': {'period': '1d', 'window': 2000, 'max_gap': 60, 'session_break': 6 * 60 * 60, 'archive_after_days': 7},
+    '1d': {'period': '1mo', 'window': 300, 'max_gap': 5 * 24 * 60 * 60, 'session_break': float('inf'), 'archive_after_days': None},
+}
@@ -0,0 +1,440 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .config import SQLITE_BUSY_TIMEOUT, SQLITE_POOL_SIZE, SQLITE_PRAGMAS, SQLITE_STATEMENT_CACHE
+from .metrics import metrics
+from .resources import cached_resource, logger
+
+# 股票價格資料表：以 (symbol, interval, ts) 為主鍵，ts 為 UTC epoch 秒
+STOCK_DATA_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS stock_data (
+        symbol TEXT NOT NULL,
+        interval TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        PRIMARY KEY (symbol, interval, ts)
+    ) WITHOUT ROWID
+'''
+
+# 版本 1：stock_data 改為有主鍵的 WITHOUT ROWID 表，並移除舊表中重複的 K 線
+def _migrate_stock_data_v1(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(stock_data)")]
+    schema = '''
+        CREATE TABLE IF NOT EXISTS stock_data (
+            symbol TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume INTEGER,
+            PRIMARY KEY (symbol, ts)
+        ) WITHOUT ROWID
+    '''
+    if 'date' not in columns:
+        c.execute(schema)
+        return False
+    c.execute("ALTER TABLE stock_data RENAME TO stock_data_v0")
+    c.execute(schema)
+    # 舊資料的 date 為台灣時間字串（UTC+8，無日光節約），同一根 K 線保留最後寫入的一筆
+    c.execute('''
+        INSERT OR REPLACE INTO stock_data (symbol, ts, open, high, low, close, volume)
+        SELECT symbol, CAST(strftime('%s', date) AS INTEGER) - 8 * 3600, open, high, low, close, volume
+        FROM stock_data_v0
+        WHERE symbol IS NOT NULL AND strftime('%s', date) IS NOT NULL
+        ORDER BY rowid
+    ''')
+    c.execute("DROP TABLE stock_data_v0")
+    return True
+
+# 版本 2：stock_data 加入 K 線週期欄位（既有資料皆為 1 分鐘 K 線）
+def _migrate_stock_data_v2(c):
+    c.execute("ALTER TABLE stock_data RENAME TO stock_data_v1")
+    c.execute(STOCK_DATA_SCHEMA)
+    c.execute('''
+        INSERT INTO stock_data (symbol, interval, ts, open, high, low, close, volume)
+        SELECT symbol, '1m', ts, open, high, low, close, volume FROM stock_data_v1
+    ''')
+    c.execute("DROP TABLE stock_data_v1")
+    return False
+
+# 版本 3：stock_list 加入分類與 Yahoo 代號後綴（既有資料皆為上市股票），並讓股票清單下次立即更新以納入上櫃股票與 ETF
+def _migrate_stock_list_v3(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(stock_list)")]
+    if 'suffix' not in columns:
+        c.execute("ALTER TABLE stock_list ADD COLUMN category TEXT DEFAULT '股票'")
+        c.execute("ALTER TABLE stock_list ADD COLUMN suffix TEXT DEFAULT '.TW'")
+    c.execute("DELETE FROM metadata WHERE key = 'stock_list_fetched_at'")
+    return False
+
+# 持股由觸發程序維護：purchase_history 為交易紀錄（數量為負表示減碼，價格為當時的平均成本），
+# 每筆紀錄新增 / 修改 / 刪除時只更新該股票的數量與總成本，數量歸零即移除持股
+PORTFOLIO_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS purchase_history_insert AFTER INSERT ON purchase_history BEGIN
+        INSERT OR IGNORE INTO portfolio (symbol, name, quantity, total_cost) VALUES (NEW.symbol, NEW.symbol, 0, 0);
+        UPDATE portfolio SET quantity = quantity + NEW.quantity, total_cost = total_cost + NEW.quantity * NEW.purchase_price
+        WHERE symbol = NEW.symbol;
+        DELETE FROM portfolio WHERE symbol = NEW.symbol AND quantity = 0;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS purchase_history_delete AFTER DELETE ON purchase_history BEGIN
+        INSERT OR IGNORE INTO portfolio (symbol, name, quantity, total_cost) VALUES (OLD.symbol, OLD.symbol, 0, 0);
+        UPDATE portfolio SET quantity = quantity - OLD.quantity, total_cost = total_cost - OLD.quantity * OLD.purchase_price
+        WHERE symbol = OLD.symbol;
+        DELETE FROM portfolio WHERE symbol = OLD.symbol AND quantity = 0;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS purchase_history_update AFTER UPDATE ON purchase_history BEGIN
+        INSERT OR IGNORE INTO portfolio (symbol, name, quantity, total_cost) VALUES (OLD.symbol, OLD.symbol, 0, 0);
+        UPDATE portfolio SET quantity = quantity - OLD.quantity, total_cost = total_cost - OLD.quantity * OLD.purchase_price
+        WHERE symbol = OLD.symbol;
+        INSERT OR IGNORE INTO portfolio (symbol, name, quantity, total_cost) VALUES (NEW.symbol, NEW.symbol, 0, 0);
+        UPDATE portfolio SET quantity = quantity + NEW.quantity, total_cost = total_cost + NEW.quantity * NEW.purchase_price
+        WHERE symbol = NEW.symbol;
+        DELETE FROM portfolio WHERE symbol IN (OLD.symbol, NEW.symbol) AND quantity = 0;
+    END
+    ''',
+]
+
+# 版本 4：持股改由 purchase_history 觸發程序維護。舊版表格編輯只改 portfolio.quantity，
+# 先以平均成本補上調整紀錄讓交易紀錄與持股一致，再由交易紀錄重算數量與總成本
+def _migrate_portfolio_v4(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(portfolio)")]
+    if 'total_cost' not in columns:
+        c.execute("ALTER TABLE portfolio ADD COLUMN total_cost REAL NOT NULL DEFAULT 0")
+    c.execute("DELETE FROM portfolio WHERE symbol IS NULL")
+    c.execute('''
+        INSERT INTO purchase_history (symbol, purchase_date, purchase_price, quantity)
+        SELECT symbol, datetime('now', 'localtime'), avg_price, target - held FROM (
+            SELECT h.symbol,
+                   COALESCE(p.quantity, 0) AS target,
+                   SUM(h.quantity) AS held,
+                   CASE WHEN SUM(h.quantity) > 0 THEN SUM(h.purchase_price * h.quantity) / SUM(h.quantity) ELSE 0 END AS avg_price
+            FROM purchase_history h
+            LEFT JOIN portfolio p ON p.symbol = h.symbol
+            GROUP BY h.symbol
+        )
+        WHERE target != held
+    ''')
+    # 只在表格中輸入、沒有購買紀錄的持股（成本不明，與舊版相同以 0 計）
+    c.execute('''
+        INSERT INTO purchase_history (symbol, purchase_date, purchase_price, quantity)
+        SELECT symbol, datetime('now', 'localtime'), 0, quantity FROM portfolio p
+        WHERE quantity != 0 AND NOT EXISTS (SELECT 1 FROM purchase_history h WHERE h.symbol = p.symbol)
+    ''')
+    c.execute('''
+        UPDATE portfolio SET
+            quantity = COALESCE((SELECT SUM(quantity) FROM purchase_history h WHERE h.symbol = portfolio.symbol), 0),
+            total_cost = COALESCE((SELECT SUM(purchase_price * quantity) FROM purchase_history h WHERE h.symbol = portfolio.symbol), 0)
+    ''')
+    c.execute("DELETE FROM portfolio WHERE quantity = 0")
+    for trigger in PORTFOLIO_TRIGGERS:
+        c.execute(trigger)
+    return False
+
+# 投資組合歷史的重算起點：交易紀錄新增 / 修改 / 刪除時，把 metadata 中的 portfolio_history_dirty
+# 設為受影響的最早日期（無法解析的日期視為全部重算），下次更新從該日起重算
+PORTFOLIO_HISTORY_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS portfolio_history_insert AFTER INSERT ON purchase_history BEGIN
+        INSERT INTO metadata (key, value) VALUES ('portfolio_history_dirty', COALESCE(date(NEW.purchase_date), ''))
+        ON CONFLICT (key) DO UPDATE SET value = MIN(value, excluded.value);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS portfolio_history_delete AFTER DELETE ON purchase_history BEGIN
+        INSERT INTO metadata (key, value) VALUES ('portfolio_history_dirty', COALESCE(date(OLD.purchase_date), ''))
+        ON CONFLICT (key) DO UPDATE SET value = MIN(value, excluded.value);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS portfolio_history_update AFTER UPDATE ON purchase_history BEGIN
+        INSERT INTO metadata (key, value)
+        VALUES ('portfolio_history_dirty', MIN(COALESCE(date(OLD.purchase_date), ''), COALESCE(date(NEW.purchase_date), '')))
+        ON CONFLICT (key) DO UPDATE SET value = MIN(value, excluded.value);
+    END
+    ''',
+]
+
+# 版本 5：投資組合歷史（portfolio_snapshots / portfolio_totals 由 _create_tables 建立，首次更新時從頭計算）
+def _migrate_portfolio_history_v5(c):
+    for trigger in PORTFOLIO_HISTORY_TRIGGERS:
+        c.execute(trigger)
+    return False
+
+# 版本 6：依週期與時間的索引（選股器的版本查詢與全市場日 K 線讀取不必掃描整個 stock_data）
+def _migrate_stock_data_index_v6(c):
+    c.execute("CREATE INDEX IF NOT EXISTS stock_data_interval_ts ON stock_data (interval, ts)")
+    return False
+
+# 依 PRAGMA user_version 依序執行的資料表升級（回傳 True 表示需要 VACUUM）
+SCHEMA_MIGRATIONS = [
+    _migrate_stock_data_v1, _migrate_stock_data_v2, _migrate_stock_list_v3, _migrate_portfolio_v4,
+    _migrate_portfolio_history_v5, _migrate_stock_data_index_v6,
+]
+
+# 資料庫存取層：連線池中的連線長期保留（沿用已編譯的 SQL 敘述快取），
+# 使用 WAL 模式讓讀取不會擋住背景輪詢的寫入；寫入一律透過 transaction() 明確開始與結束
+class Database:
+    def __init__(self, path, pool_size=SQLITE_POOL_SIZE):
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.path = path
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+        )
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    # 從連線池借出一條連線（池滿時等待其他執行緒歸還）
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.pool_size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._pool.get(timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    # 寫入交易（BEGIN IMMEDIATE 一開始就取得寫入鎖，避免交易中途升級失敗）
+    @contextmanager
+    def transaction(self):
+        with metrics.span('sqlite.transaction'), self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def query(self, sql, params=()):
+        with metrics.span('sqlite.query'), self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_df(self, sql, params=()):
+        with metrics.span('sqlite.query'), self.connection() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+# 每個資料庫檔案在程序內共用一個連線池
+@cached_resource
+def get_database(db_path):
+    return Database(db_path)
+
+# 資料表結構（每個程序每個資料庫只建立一次，之後的 rerun 直接略過）
+@cached_resource
+def _create_schema(db_path):
+    db = get_database(db_path)
+    with db.connection() as c:
+        _create_tables(c)
+    # 依版本號執行資料表升級（BEGIN IMMEDIATE 避免多個程序同時升級）
+    with db.transaction() as c:
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        needs_vacuum = False
+        for target, migrate in enumerate(SCHEMA_MIGRATIONS, start=1):
+            if version < target:
+                needs_vacuum = migrate(c) or needs_vacuum
+                c.execute(f"PRAGMA user_version = {target}")
+    if needs_vacuum:
+        with db.connection() as c:
+            c.execute("VACUUM")
+    return True
+
+# 建立各資料表
+def _create_tables(c):
+    # 股票清單資料表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS stock_list (
+            code TEXT PRIMARY KEY,
+            name TEXT,
+            isin TEXT,
+            date_listed TEXT,
+            market TEXT,
+            industry TEXT,
+            cficode TEXT,
+            category TEXT,
+            suffix TEXT
+        )
+    ''')
+    # 投資清單資料表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio (
+            symbol TEXT PRIMARY KEY,
+            name TEXT,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            total_cost REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    # 購買歷史資料表（交易紀錄，持股由觸發程序維護，見 PORTFOLIO_TRIGGERS）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT,
+            purchase_date TEXT,
+            purchase_price REAL,
+            quantity INTEGER
+        )
+    ''')
+    # 投資組合每日歷史：每天每檔持股一列，以及每天的合計（由 purchase_history 與日 K 線收盤價計算）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            date TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            cost REAL NOT NULL,
+            close REAL,
+            value REAL NOT NULL,
+            PRIMARY KEY (date, symbol)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_totals (
+            date TEXT PRIMARY KEY,
+            cost REAL NOT NULL,
+            value REAL NOT NULL,
+            profit_loss REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    # 串流指標狀態資料表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS indicator_state (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            spec TEXT NOT NULL,
+            last_ts INTEGER,
+            state TEXT,
+            PRIMARY KEY (symbol, interval, spec)
+        ) WITHOUT ROWID
+    ''')
+    # 行情快取資料表（重啟後沿用未過期的基本資料）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            expires_at REAL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+    ''')
+    # 警示規則與觸發紀錄資料表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            threshold REAL NOT NULL,
+            window INTEGER,
+            hysteresis REAL NOT NULL DEFAULT 0.5,
+            active INTEGER NOT NULL DEFAULT 1,
+            armed INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_active ON alerts (symbol) WHERE active = 1")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS alert_triggers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alert_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            value REAL,
+            message TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alert_triggers_symbol_ts ON alert_triggers (symbol, ts)")
+    # 已匯入的每日收盤行情檔案（檔案大小與修改時間未變者不重複匯入）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_files (
+            date TEXT PRIMARY KEY,
+            path TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            rows INTEGER,
+            ingested_at TEXT
+        )
+    ''')
+    # 系統資訊資料表（股票清單雜湊值、抓取時間等）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+# 資料庫初始化（包含股票清單、投資清單、購買歷史表）
+def init_database(db_path):
+    try:
+        _create_schema(db_path)
+    except Exception as e:
+        logger.error(f"Database initialization failed: {str(e)}")
+
+# 讀取 / 寫入系統資訊
+def get_metadata(conn, key, default=None):
+    row = conn.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_metadata(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, str(value)))
+
+# 投資組合歷史需從 date（YYYY-MM-DD）起重算（例如補匯入過去的收盤價）；已標記更早的日期時不變
+def mark_portfolio_history_dirty(conn, date):
+    conn.execute('''
+        INSERT INTO metadata (key, value) VALUES ('portfolio_history_dirty', ?)
+        ON CONFLICT (key) DO UPDATE SET value = MIN(value, excluded.value)
+    ''', (date,))
+
+# 日 K 線變動計數（寫入日 K 線的交易中累加，選股器以此判斷是否需要重新計算）
+def bump_daily_bars_version(conn):
+    conn.execute('''
+        INSERT INTO metadata (key, value) VALUES ('daily_bars_version', 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1
+    ''')
@@ -0,0 +1,308 @@
+import copy
+import json
+import math
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from .config import DEFAULT_INDICATORS, INDICATOR_HISTORY, MARKET_TZ
+from .db import get_database
+from .metrics import timed
+from .resources import cached_resource
+
+# 串流指標基底：update() 提交一根已收盤 K 線（每根 O(1)），peek() 計算未收盤 K 線的暫定值
+class StreamingIndicator:
+    def update(self, close):
+        raise NotImplementedError
+
+    def values(self):
+        raise NotImplementedError
+
+    def peek(self, close):
+        probe = copy.deepcopy(self)
+        probe.update(close)
+        return probe.values()
+
+    def state(self):
+        return dict(self.__dict__)
+
+    def load(self, state):
+        self.__dict__.update(state)
+
+# 指數移動平均的遞迴（與 pandas ewm(adjust=False) 相同，第一筆資料為初始值）
+class _EWM:
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.mean = None
+        self.count = 0
+
+    def update(self, x):
+        self.mean = x if self.mean is None else (1 - self.alpha) * self.mean + self.alpha * x
+        self.count += 1
+        return self.mean
+
+# 簡單移動平均：固定長度視窗 + 累計和（每個視窗長度重新加總一次，避免浮點誤差累積）
+class StreamingSMA(StreamingIndicator):
+    def __init__(self, window):
+        self.window = window
+        self.window_values = deque()
+        self.total = 0.0
+        self.updates = 0
+
+    def update(self, close):
+        self.window_values.append(close)
+        self.total += close
+        if len(self.window_values) > self.window:
+            self.total -= self.window_values.popleft()
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self.total = math.fsum(self.window_values)
+
+    def values(self):
+        ready = len(self.window_values) == self.window
+        return {f"sma_{self.window}": self.total / self.window if ready else np.nan}
+
+    def state(self):
+        return {'window_values': list(self.window_values), 'total': self.total, 'updates': self.updates}
+
+    def load(self, state):
+        self.window_values = deque(state['window_values'])
+        self.total = state['total']
+        self.updates = state['updates']
+
+# 指數移動平均（同 ta.trend.EMAIndicator）
+class StreamingEMA(StreamingIndicator):
+    def __init__(self, window):
+        self.window = window
+        self.ewm = _EWM(2 / (window + 1))
+
+    def update(self, close):
+        self.ewm.update(close)
+
+    def values(self):
+        return {f"ema_{self.window}": self.ewm.mean if self.ewm.count >= self.window else np.nan}
+
+    def state(self):
+        return dict(self.ewm.__dict__)
+
+    def load(self, state):
+        self.ewm.__dict__.update(state)
+
+# RSI：漲跌幅以 Wilder 平滑（alpha = 1 / window，同 ta.momentum.RSIIndicator）
+class StreamingRSI(StreamingIndicator):
+    def __init__(self, window):
+        self.window = window
+        self.prev_close = None
+        self.gain = _EWM(1 / window)
+        self.loss = _EWM(1 / window)
+
+    def update(self, close):
+        change = 0.0 if self.prev_close is None else close - self.prev_close
+        self.gain.update(max(change, 0.0))
+        self.loss.update(max(-change, 0.0))
+        self.prev_close = close
+
+    def values(self):
+        if self.gain.count < self.window:
+            return {f"rsi_{self.window}": np.nan}
+        if self.loss.mean == 0:
+            return {f"rsi_{self.window}": 100.0}
+        return {f"rsi_{self.window}": 100 - 100 / (1 + self.gain.mean / self.loss.mean)}
+
+    def state(self):
+        return {'prev_close': self.prev_close, 'gain': dict(self.gain.__dict__), 'loss': dict(self.loss.__dict__)}
+
+    def load(self, state):
+        self.prev_close = state['prev_close']
+        self.gain.__dict__.update(state['gain'])
+        self.loss.__dict__.update(state['loss'])
+
+# MACD：快慢 EMA 差與其訊號線（同 ta.trend.MACD）
+class StreamingMACD(StreamingIndicator):
+    def __init__(self, slow=26, fast=12, sign=9):
+        self.slow, self.fast, self.sign = slow, fast, sign
+        self.fast_ewm = _EWM(2 / (fast + 1))
+        self.slow_ewm = _EWM(2 / (slow + 1))
+        self.signal_ewm = _EWM(2 / (sign + 1))
+        self.macd = np.nan
+
+    def update(self, close):
+        self.fast_ewm.update(close)
+        self.slow_ewm.update(close)
+        if self.fast_ewm.count >= self.fast and self.slow_ewm.count >= self.slow:
+            self.macd = self.fast_ewm.mean - self.slow_ewm.mean
+            self.signal_ewm.update(self.macd)
+
+    def values(self):
+        signal = self.signal_ewm.mean if self.signal_ewm.count >= self.sign else np.nan
+        return {'macd': self.macd, 'macd_signal': signal, 'macd_diff': self.macd - signal}
+
+    def state(self):
+        return {name: dict(getattr(self, name).__dict__) for name in ('fast_ewm', 'slow_ewm', 'signal_ewm')} | {'macd': self.macd}
+
+    def load(self, state):
+        for name in ('fast_ewm', 'slow_ewm', 'signal_ewm'):
+            getattr(self, name).__dict__.update(state[name])
+        self.macd = state['macd']
+
+# 布林通道：固定長度視窗的累計和與平方和（母體標準差，同 ta.volatility.BollingerBands）
+class StreamingBollinger(StreamingIndicator):
+    def __init__(self, window=20, window_dev=2):
+        self.window = window
+        self.window_dev = window_dev
+        self.sma = StreamingSMA(window)
+        self.squares = StreamingSMA(window)
+
+    def update(self, close):
+        self.sma.update(close)
+        self.squares.update(close * close)
+
+    def values(self):
+        if len(self.sma.window_values) < self.window:
+            return {'bb_mavg': np.nan, 'bb_hband': np.nan, 'bb_lband': np.nan}
+        mean = self.sma.total / self.window
+        std = math.sqrt(max(self.squares.total / self.window - mean * mean, 0.0))
+        return {'bb_mavg': mean, 'bb_hband': mean + self.window_dev * std, 'bb_lband': mean - self.window_dev * std}
+
+    def state(self):
+        return {'sma': self.sma.state(), 'squares': self.squares.state()}
+
+    def load(self, state):
+        self.sma.load(state['sma'])
+        self.squares.load(state['squares'])
+
+# 指標名稱 → 類別（規格字串如 'sma:5'、'macd:26:12:9'）
+INDICATOR_TYPES = {
+    'sma': StreamingSMA,
+    'ema': StreamingEMA,
+    'rsi': StreamingRSI,
+    'macd': StreamingMACD,
+    'bb': StreamingBollinger,
+}
+
+def make_indicator(spec):
+    kind, *params = spec.split(':')
+    return INDICATOR_TYPES[kind](*[int(p) for p in params])
+
+# 以 ta 套件整批計算相同指標（作為串流指標的對照基準）
+def reference_indicators(close, specs):
+    from ta.trend import SMAIndicator, EMAIndicator, MACD
+    from ta.momentum import RSIIndicator
+    from ta.volatility import BollingerBands
+    columns = {}
+    for spec in specs:
+        kind, *params = spec.split(':')
+        params = [int(p) for p in params]
+        if kind == 'sma':
+            columns[f"sma_{params[0]}"] = SMAIndicator(close, window=params[0]).sma_indicator()
+        elif kind == 'ema':
+            columns[f"ema_{params[0]}"] = EMAIndicator(close, window=params[0]).ema_indicator()
+        elif kind == 'rsi':
+            columns[f"rsi_{params[0]}"] = RSIIndicator(close, window=params[0]).rsi()
+        elif kind == 'macd':
+            macd = MACD(close, *params)
+            columns.update(macd=macd.macd(), macd_signal=macd.macd_signal(), macd_diff=macd.macd_diff())
+        elif kind == 'bb':
+            bands = BollingerBands(close, *params)
+            columns.update(bb_mavg=bands.bollinger_mavg(), bb_hband=bands.bollinger_hband(), bb_lband=bands.bollinger_lband())
+    return pd.DataFrame(columns, index=close.index)
+
+# 一組指標在單一 symbol / 週期上的狀態：已提交的最後時間、各指標狀態、最近的指標值
+class IndicatorSeries:
+    def __init__(self, specs):
+        self.specs = specs
+        self.indicators = [make_indicator(spec) for spec in specs]
+        self.last_ts = None
+        self.history = deque(maxlen=INDICATOR_HISTORY)
+
+    def commit(self, ts, close):
+        row = {}
+        for indicator in self.indicators:
+            indicator.update(close)
+            row.update(indicator.values())
+        self.last_ts = ts
+        self.history.append((ts, row))
+
+    def peek(self, close):
+        row = {}
+        for indicator in self.indicators:
+            row.update(indicator.peek(close))
+        return row
+
+    def to_json(self):
+        return json.dumps({
+            'last_ts': self.last_ts,
+            'indicators': [indicator.state() for indicator in self.indicators],
+            'history': list(self.history),
+        })
+
+    @classmethod
+    def from_json(cls, specs, text):
+        series = cls(specs)
+        data = json.loads(text)
+        series.last_ts = data['last_ts']
+        for indicator, state in zip(series.indicators, data['indicators']):
+            indicator.load(state)
+        series.history.extend((ts, row) for ts, row in data['history'])
+        return series
+
+# 串流指標引擎：各 symbol / 週期只對新收盤的 K 線推進指標，狀態存入 indicator_state 以免重啟後重算歷史
+class IndicatorEngine:
+    def __init__(self, specs=DEFAULT_INDICATORS):
+        self.specs = list(specs)
+        self.spec_key = ','.join(self.specs)
+        self.series = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, db, symbol, interval):
+        rows = db.query('''
+            SELECT state FROM indicator_state WHERE symbol = ? AND interval = ? AND spec = ?
+        ''', (symbol, interval, self.spec_key))
+        return IndicatorSeries.from_json(self.specs, rows[0][0]) if rows else IndicatorSeries(self.specs)
+
+    # 推進指標並回傳指標序列（最後一根 K 線視為未收盤，只計算暫定值不提交）
+    @timed('indicators.advance')
+    def advance(self, db_path, symbol, interval, bars):
+        key = (db_path, symbol, interval)
+        with self._lock_for(key):
+            db = get_database(db_path)
+            series = self.series.get(key)
+            if series is None:
+                series = self._load(db, symbol, interval)
+            ts = bars.index.asi8 // 10**9
+            closes = bars['Close'].to_numpy(dtype=float)
+            # 記憶體中的 K 線不含上次提交之後的全部資料時，從資料庫補齊
+            if series.last_ts is not None and len(ts) and ts[0] > series.last_ts:
+                missing = db.query_df('''
+                    SELECT ts, close FROM stock_data WHERE symbol = ? AND interval = ? AND ts > ? AND ts < ? ORDER BY ts
+                ''', (symbol, interval, series.last_ts, int(ts[0])))
+                ts = np.concatenate([missing['ts'].to_numpy(dtype='int64'), ts])
+                closes = np.concatenate([missing['close'].to_numpy(dtype=float), closes])
+            start = 0 if series.last_ts is None else int(np.searchsorted(ts, series.last_ts, side='right'))
+            committed = False
+            for i in range(start, len(ts) - 1):
+                series.commit(int(ts[i]), float(closes[i]))
+                committed = True
+            if committed:
+                with db.transaction() as conn:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO indicator_state (symbol, interval, spec, last_ts, state)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (symbol, interval, self.spec_key, series.last_ts, series.to_json()))
+            self.series[key] = series
+            rows = list(series.history)
+            if len(ts) and (series.last_ts is None or ts[-1] > series.last_ts):
+                rows.append((int(ts[-1]), series.peek(float(closes[-1]))))
+            index = pd.to_datetime([row[0] for row in rows], unit='s', utc=True).tz_convert(MARKET_TZ)
+            return pd.DataFrame([row[1] for row in rows], index=index)
+
+@cached_resource
+def get_indicator_engine():
+    return IndicatorEngine()
@@ -0,0 +1,159 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from .config import METRICS_ENV, METRICS_FILE_ENV
+
+# 停用時所有 span 共用的空 context
+_NOOP = nullcontext()
+
+# 計時區段：離開時把經過秒數記到 Metrics
+class _Span:
+    __slots__ = ('metrics', 'key', 'started')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics._observe(self.key, time.perf_counter() - self.started, exc_type is not None)
+        return False
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+# 程序內的計時與計數：span() 量測區段耗時，count() 累加計數器；
+# 停用時 span() 回傳共用的空 context、count() 直接返回，幾乎沒有額外成本
+class Metrics:
+    def __init__(self, enabled=False, export_path=None):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.spans = {}
+        self.counters = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, _key(name, labels))
+
+    # 記錄一次在 span 之外量測的耗時
+    def record(self, name, seconds, **labels):
+        if self.enabled:
+            self._observe(_key(name, labels), seconds)
+
+    # 各區段的統計：[次數, 總秒數, 最長秒數, 錯誤次數]
+    def _observe(self, key, seconds, failed=False):
+        with self._lock:
+            stats = self.spans.get(key)
+            if stats is None:
+                stats = self.spans[key] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += failed
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled or not value:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+            self.started_at = time.time()
+
+    # 目前的統計（供診斷面板顯示）：(spans, counters)，各為 dict 的 list
+    def snapshot(self):
+        with self._lock:
+            spans = [
+                {'span': name, 'labels': dict(labels), 'calls': stats[0], 'total_ms': stats[1] * 1000,
+                 'mean_ms': stats[1] / stats[0] * 1000, 'max_ms': stats[2] * 1000, 'errors': stats[3]}
+                for (name, labels), stats in self.spans.items()
+            ]
+            counters = [
+                {'counter': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self.counters.items()
+            ]
+        return sorted(spans, key=lambda row: -row['total_ms']), sorted(counters, key=lambda row: row['counter'])
+
+    # Prometheus 文字格式（node_exporter textfile collector 可直接讀取）
+    def to_prometheus(self):
+        spans, counters = self.snapshot()
+        lines = [
+            '# HELP stock_tracker_span_seconds Time spent in instrumented code paths.',
+            '# TYPE stock_tracker_span_seconds summary',
+        ]
+        for row in spans:
+            labels = _prometheus_labels({'span': row['span'], **row['labels']})
+            lines.append(f"stock_tracker_span_seconds_count{labels} {row['calls']}")
+            lines.append(f"stock_tracker_span_seconds_sum{labels} {row['total_ms'] / 1000:.6f}")
+        lines.append('# TYPE stock_tracker_span_max_seconds gauge')
+        for row in spans:
+            labels = _prometheus_labels({'span': row['span'], **row['labels']})
+            lines.append(f"stock_tracker_span_max_seconds{labels} {row['max_ms'] / 1000:.6f}")
+        lines.append('# TYPE stock_tracker_span_errors_total counter')
+        for row in spans:
+            labels = _prometheus_labels({'span': row['span'], **row['labels']})
+            lines.append(f"stock_tracker_span_errors_total{labels} {row['errors']}")
+        for name in sorted({row['counter'] for row in counters}):
+            lines.append(f"# TYPE stock_tracker_{name}_total counter")
+            for row in counters:
+                if row['counter'] == name:
+                    lines.append(f"stock_tracker_{name}_total{_prometheus_labels(row['labels'])} {row['value']}")
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        spans, counters = self.snapshot()
+        return json.dumps({'ts': time.time(), 'since': self.started_at, 'spans': spans, 'counters': counters}, ensure_ascii=False)
+
+    # 匯出到檔案：.jsonl 每次附加一行，其他副檔名以 Prometheus 文字格式整檔替換
+    # （背景輪詢與各頁面都會匯出，同一時間只有一個寫入，避免共用的暫存檔被其他執行緒搬走）
+    def export(self, path=None):
+        path = path or self.export_path
+        if not path or not self.enabled:
+            return
+        with self._export_lock:
+            if path.endswith('.jsonl'):
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(self.to_json() + '\n')
+                return
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(path + '.tmp', path)
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"') for key, value in labels.items()}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(escaped.items())) + '}'
+
+# 程序內共用的計測（環境變數 STOCK_TRACKER_METRICS=1 或設定匯出檔案時啟用）
+metrics = Metrics(
+    enabled=os.environ.get(METRICS_ENV, '') not in ('', '0') or bool(os.environ.get(METRICS_FILE_ENV)),
+    export_path=os.environ.get(METRICS_FILE_ENV) or None,
+)
+
+# 函式計時裝飾器（停用時只多一次屬性檢查）
+def timed(name, **labels):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            with metrics.span(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from .alerts import alert_metrics, get_alert_engine
+from .archive import compact_if_due
+from .bars import latest_session, sync_many
+from .config import POLL_INTERVAL, POLL_SESSION_TTL
+from .indicators import get_indicator_engine
+from .metrics import metrics, timed
+from .resources import cached_resource, logger
+
+# 背景輪詢服務：每個伺服器程序只有一個執行緒，定期對所有 session 關注的股票（聯集）
+# 批次同步 K 線與指標，結果存為共用快照，各 session 只讀取快照
+class QuotePoller:
+    def __init__(self, interval=POLL_INTERVAL, session_ttl=POLL_SESSION_TTL):
+        self.interval = interval
+        self.session_ttl = session_ttl
+        self.watchers = {}
+        self.alert_sources = {}
+        self.snapshots = {}
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # session 登記關注的股票（每次顯示時更新 last_seen，逾時未更新的 session 自動移除）
+    def watch(self, session_id, db_path, provider, symbols):
+        with self._lock:
+            self.watchers[session_id] = (db_path, provider, frozenset(symbols), time.time())
+            self._start()
+
+    # 登記有警示規則的資料庫與其資料來源：規則的股票不需要有 session 關注也會持續輪詢
+    def watch_alerts(self, db_path, provider):
+        with self._lock:
+            self.alert_sources[db_path] = provider
+            self._start()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='quote-poller', daemon=True)
+            self._thread.start()
+
+    def unwatch(self, session_id):
+        with self._lock:
+            self.watchers.pop(session_id, None)
+
+    def snapshot(self, db_path, symbol):
+        return self.snapshots.get((db_path, symbol))
+
+    # 依資料庫與資料來源分組的關注股票聯集
+    def targets(self):
+        now = time.time()
+        groups = {}
+        with self._lock:
+            for session_id, (db_path, provider, symbols, last_seen) in list(self.watchers.items()):
+                if now - last_seen > self.session_ttl:
+                    del self.watchers[session_id]
+                    continue
+                groups.setdefault((db_path, provider), set()).update(symbols)
+            for db_path, provider in self.alert_sources.items():
+                if not any(group_db == db_path for group_db, _ in groups):
+                    groups[(db_path, provider)] = set()
+        # 有啟用警示規則的股票即使沒有人在看也要輪詢
+        for (db_path, provider), symbols in groups.items():
+            symbols.update(get_alert_engine(db_path).symbols())
+        return {key: symbols for key, symbols in groups.items() if symbols}
+
+    # 股票基本資料（查詢失敗時沿用上次快照的資料，不影響其他股票的報價與警示）
+    def _metadata(self, db_path, provider, symbol):
+        try:
+            return provider.metadata(symbol)
+        except Exception as e:
+            metrics.count('metadata_errors')
+            logger.error(f"Failed to fetch info for {symbol}: {str(e)}")
+            previous = self.snapshots.get((db_path, symbol))
+            return previous['info'] if previous else {}
+
+    # 立即同步指定股票並更新快照（冷啟動與手動更新時由 session 直接呼叫）
+    def refresh(self, db_path, provider, symbols):
+        intraday = sync_many(db_path, symbols, '1m', provider)
+        daily = sync_many(db_path, symbols, '1d', provider)
+        engine = get_indicator_engine()
+        snapshots = {}
+        for symbol in symbols:
+            info = self._metadata(db_path, provider, symbol)
+            history = daily[symbol]
+            snapshots[symbol] = {
+                'intraday': latest_session(intraday[symbol]),
+                'history': history,
+                'indicators': engine.advance(db_path, symbol, '1d', history).reindex(history.index),
+                'info': info,
+                'updated_at': time.time(),
+            }
+            self.snapshots[(db_path, symbol)] = snapshots[symbol]
+        get_alert_engine(db_path).evaluate(alert_metrics(snapshots))
+        return snapshots
+
+    @timed('poller.cycle')
+    def poll_once(self):
+        for (db_path, provider), symbols in self.targets().items():
+            try:
+                self.refresh(db_path, provider, sorted(symbols))
+                compact_if_due(db_path)
+                self.last_error = None
+            except Exception as e:
+                metrics.count('poll_errors')
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    # 背景執行緒：任何一輪的錯誤（例如讀取警示規則或匯出計測失敗）只記錄下來，不中止輪詢
+    def _run(self):
+        while True:
+            started = time.time()
+            try:
+                self.poll_once()
+                metrics.export()
+            except Exception as e:
+                metrics.count('poll_errors')
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Background update failed: {str(e)}")
+            time.sleep(max(self.interval - (time.time() - started), 0.5))
+
+@cached_resource
+def get_poller():
+    return QuotePoller()
@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .config import MARKET_TZ, PORTFOLIO_COLUMNS, PORTFOLIO_HISTORY_COLUMNS, QUOTE_TIMEOUT, QUOTE_WORKERS
+from .db import get_database, get_metadata, init_database
+from .metrics import metrics, timed
+from .resources import cached_resource, logger
+
+# 新增到投資清單：只寫入購買紀錄，持股數量與總成本由觸發程序更新（purchase_date 為過去的日期時，
+# 投資組合歷史從該日起重算）
+def add_to_portfolio(db_path, symbol, name, quantity, purchase_price, purchase_date=None):
+    try:
+        init_database(db_path)
+        purchase_date = pd.Timestamp(purchase_date) if purchase_date is not None else datetime.now()
+        with get_database(db_path).transaction() as c:
+            c.execute("INSERT OR IGNORE INTO portfolio (symbol, name, quantity, total_cost) VALUES (?, ?, 0, 0)", (symbol, name))
+            c.execute('''
+                INSERT INTO purchase_history (symbol, purchase_date, purchase_price, quantity)
+                VALUES (?, ?, ?, ?)
+            ''', (symbol, purchase_date.strftime('%Y-%m-%d %H:%M:%S'), purchase_price, quantity))
+    except Exception as e:
+        logger.error(f"Failed to add to portfolio: {str(e)}")
+
+# 行情查詢共用執行緒池（限制同時對資料來源發出的請求數）
+@cached_resource
+def _quote_executor():
+    return ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix='quotes')
+
+# 取得多檔股票的最新價格：先整批查詢，失敗或缺漏的股票再各自查詢；
+# 逾時或失敗的股票價格為 NaN，不會拖住其他股票
+@timed('portfolio.quotes')
+def fetch_latest_prices(provider, symbols, timeout=QUOTE_TIMEOUT):
+    prices = pd.Series(np.nan, index=pd.Index(symbols, name='symbol'), dtype=float)
+    if not symbols:
+        return prices
+    executor = _quote_executor()
+    try:
+        quotes = executor.submit(provider.quotes, symbols).result(timeout=timeout)
+        prices.update(quotes['price'])
+    except Exception:
+        pass
+    missing = prices.index[prices.isna()].tolist()
+    if missing:
+        futures = {executor.submit(provider.quotes, [symbol]): symbol for symbol in missing}
+        done, _ = wait(futures, timeout=timeout)
+        for future in done:
+            symbol = futures[future]
+            if future.exception() is None and symbol in future.result().index:
+                prices[symbol] = future.result().at[symbol, 'price']
+    return prices
+
+# 投資組合估值：持股（數量與總成本由觸發程序維護）只需讀取 portfolio 表，
+# 現價、成本與損益以欄位運算一次算完
+@timed('portfolio.value')
+def value_portfolio(db_path, provider):
+    portfolio_df = get_database(db_path).query_df("SELECT symbol, name, quantity, total_cost FROM portfolio ORDER BY symbol")
+    if portfolio_df.empty:
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+    prices = fetch_latest_prices(provider, portfolio_df['symbol'].tolist())
+    total_cost = portfolio_df['total_cost'].fillna(0).to_numpy(dtype=float)
+    quantity = portfolio_df['quantity'].fillna(0).to_numpy(dtype=float)
+    current_price = prices.reindex(portfolio_df['symbol']).fillna(0).to_numpy()
+    avg_price = np.divide(total_cost, quantity, out=np.zeros_like(total_cost), where=quantity > 0)
+    valid = (avg_price > 0) & (current_price > 0)
+    portfolio_df['current_price'] = current_price
+    portfolio_df['avg_purchase_price'] = avg_price
+    portfolio_df['cost_basis'] = total_cost
+    portfolio_df['profit_loss'] = np.where(valid, quantity * (current_price - avg_price), 0.0)
+    portfolio_df['profit_loss_rate'] = np.where(valid, (current_price - avg_price) / np.where(valid, avg_price, 1) * 100, 0.0)
+    portfolio_df = portfolio_df[PORTFOLIO_COLUMNS]
+    portfolio_df.attrs['missing_quotes'] = prices.index[prices.isna()].tolist()
+    return portfolio_df
+
+# 從資料庫載入投資清單並計算均價
+def load_portfolio(db_path, provider):
+    try:
+        init_database(db_path)
+        return value_portfolio(db_path, provider)
+    except Exception as e:
+        logger.error(f"Failed to load portfolio: {str(e)}")
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS)
+
+# 儲存表格編輯：只套用 st.data_editor 回報的差異（edited_rows / deleted_rows，列號對應 portfolio_df），
+# 在同一個交易中寫成交易紀錄，持股由觸發程序更新。修改數量與刪除列為「將持股設為 N 股」，
+# 以當時的平均成本增減（重複套用不會再變動）；新增持股經由 add_to_portfolio。回傳寫入的紀錄數
+def save_portfolio_changes(db_path, portfolio_df, changes):
+    targets = []
+    for position, edits in changes.get('edited_rows', {}).items():
+        if edits.get('quantity') is not None:
+            targets.append((portfolio_df['symbol'].iloc[int(position)], int(edits['quantity'])))
+    for position in changes.get('deleted_rows', []):
+        targets.append((portfolio_df['symbol'].iloc[int(position)], 0))
+    try:
+        init_database(db_path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with get_database(db_path).transaction() as c:
+            return c.executemany('''
+                INSERT INTO purchase_history (symbol, purchase_date, purchase_price, quantity)
+                SELECT symbol, ?, total_cost / quantity, ? - quantity FROM portfolio
+                WHERE symbol = ? AND quantity > 0 AND quantity != ?
+            ''', [(now, quantity, symbol, quantity) for symbol, quantity in targets]).rowcount
+    except Exception as e:
+        logger.error(f"Failed to save portfolio changes: {str(e)}")
+        return 0
+
+# 投資組合每日歷史：交易紀錄依日期累計為（交易日 × 股票）的持股與成本陣列，乘上同樣形狀的收盤價陣列
+# （停牌日沿用前一個收盤價，previous 為計算起點之前最後的收盤價；沒有收盤價時以成本計價，損益為 0）。
+# 交易紀錄計入當天（非交易日則為下一個交易日）起的持股，起點之前的紀錄全部累計在第一天。
+# 回傳 (portfolio_snapshots 資料列, portfolio_totals 資料列)
+def compute_portfolio_history(ledger, closes, previous):
+    dates = np.unique(closes['date'].to_numpy(dtype=str))
+    if len(dates) == 0:
+        return [], []
+    symbols = pd.Index(sorted(ledger['symbol'].unique()))
+    close = np.full((len(dates) + 1, len(symbols)), np.nan)
+    close[0, symbols.get_indexer(previous['symbol'])] = previous['close'].to_numpy(dtype=float)
+    close[1 + np.searchsorted(dates, closes['date'].to_numpy(dtype=str)),
+          symbols.get_indexer(closes['symbol'])] = closes['close'].to_numpy(dtype=float)
+    close = pd.DataFrame(close).ffill().to_numpy()[1:]
+    day = np.searchsorted(dates, ledger['date'].to_numpy(dtype=str))
+    column = symbols.get_indexer(ledger['symbol'])
+    kept = day < len(dates)
+    quantity = np.zeros(close.shape)
+    cost = np.zeros(close.shape)
+    np.add.at(quantity, (day[kept], column[kept]), ledger['quantity'].to_numpy(dtype=float)[kept])
+    np.add.at(cost, (day[kept], column[kept]), ledger['cost'].to_numpy(dtype=float)[kept])
+    quantity = quantity.cumsum(axis=0)
+    held = quantity != 0
+    cost = np.where(held, cost.cumsum(axis=0), 0.0)
+    value = np.where(held, np.where(np.isnan(close), cost, quantity * close), 0.0)
+    row, column = np.nonzero(held)
+    positions = list(zip(
+        dates[row].tolist(),
+        symbols[column].tolist(),
+        quantity[row, column].astype('int64').tolist(),
+        cost[row, column].tolist(),
+        np.where(np.isnan(close[row, column]), None, close[row, column]).tolist(),
+        value[row, column].tolist(),
+    ))
+    total_cost = cost.sum(axis=1)
+    total_value = value.sum(axis=1)
+    totals = list(zip(dates.tolist(), total_cost.tolist(), total_value.tolist(), (total_value - total_cost).tolist()))
+    return positions, totals
+
+# 增量更新投資組合每日歷史：交易紀錄與持股的日 K 線寫入時會標記最早受影響的日期，只從該日起重算，
+# 之前的資料不動；沒有標記（且已計算過）時只讀取不寫入，rebuild 時從頭計算。
+# 整個更新在單一寫入交易中完成，計算期間交易紀錄不會變動。回傳重算的天數
+@timed('portfolio.history_update')
+def update_portfolio_history(db_path, rebuild=False):
+    db = get_database(db_path)
+    if not rebuild:
+        with db.connection() as conn:
+            dirty = get_metadata(conn, 'portfolio_history_dirty')
+            computed = conn.execute("SELECT 1 FROM portfolio_totals LIMIT 1").fetchone()
+            ledger = conn.execute("SELECT 1 FROM purchase_history WHERE symbol IS NOT NULL LIMIT 1").fetchone()
+        if dirty is None and (computed or not ledger):
+            return 0
+    with db.transaction() as conn:
+        last = conn.execute("SELECT MAX(date) FROM portfolio_totals").fetchone()[0]
+        dirty = get_metadata(conn, 'portfolio_history_dirty')
+        since = min(date for date in ('' if rebuild or last is None else last, dirty) if date is not None)
+        conn.execute("DELETE FROM portfolio_snapshots WHERE date >= ?", (since,))
+        conn.execute("DELETE FROM portfolio_totals WHERE date >= ?", (since,))
+        conn.execute("DELETE FROM metadata WHERE key = 'portfolio_history_dirty'")
+        # 第一筆交易之前的日子不需要計算（沒有日期的紀錄視為最早的交易）
+        first = conn.execute('''
+            SELECT MIN(COALESCE(date(purchase_date), '')) FROM purchase_history WHERE symbol IS NOT NULL
+        ''').fetchone()[0]
+        if first is None:
+            return 0
+        start = max(since, first)
+        start_ts = int(pd.Timestamp(start).tz_localize(MARKET_TZ).timestamp()) if start else 0
+        # 起點之前的交易紀錄在 SQL 中先依股票加總為起點當天的一筆，之後的紀錄依股票與日期加總
+        ledger = pd.read_sql_query('''
+            SELECT symbol, MAX(COALESCE(date(purchase_date), ''), ?) AS date,
+                   SUM(quantity) AS quantity, SUM(purchase_price * quantity) AS cost
+            FROM purchase_history WHERE symbol IS NOT NULL GROUP BY 1, 2
+        ''', conn, params=(start,))
+        symbols = sorted(ledger['symbol'].unique())
+        placeholders = ', '.join('?' * len(symbols))
+        closes = pd.read_sql_query(f'''
+            SELECT symbol, ts, close FROM stock_data
+            WHERE interval = '1d' AND symbol IN ({placeholders}) AND ts >= ?
+        ''', conn, params=symbols + [start_ts])
+        # 每檔股票在起點之前最後的收盤價（依主鍵往回找一筆，不掃描整段歷史）
+        previous = pd.read_sql_query('''
+            SELECT symbol, (
+                SELECT close FROM stock_data d WHERE d.symbol = h.symbol AND d.interval = '1d' AND d.ts < ?
+                ORDER BY d.ts DESC LIMIT 1
+            ) AS close
+            FROM (SELECT DISTINCT symbol FROM purchase_history WHERE symbol IS NOT NULL) h
+        ''', conn, params=(start_ts,))
+        closes['date'] = pd.to_datetime(closes['ts'], unit='s', utc=True).dt.tz_convert(MARKET_TZ).dt.strftime('%Y-%m-%d')
+        positions, totals = compute_portfolio_history(ledger, closes, previous)
+        conn.executemany('''
+            INSERT INTO portfolio_snapshots (date, symbol, quantity, cost, close, value) VALUES (?, ?, ?, ?, ?, ?)
+        ''', positions)
+        conn.executemany("INSERT INTO portfolio_totals (date, cost, value, profit_loss) VALUES (?, ?, ?, ?)", totals)
+    metrics.count('rows_written', len(positions), table='portfolio_snapshots')
+    return len(totals)
+
+# 投資組合每日合計（先增量更新，再依主鍵讀取 start ~ end 的日期範圍），回傳以日期為索引的成本、市值與損益
+def load_portfolio_history(db_path, start=None, end=None):
+    try:
+        init_database(db_path)
+        update_portfolio_history(db_path)
+        history = get_database(db_path).query_df('''
+            SELECT date, cost, value, profit_loss FROM portfolio_totals WHERE date BETWEEN ? AND ? ORDER BY date
+        ''', (f"{pd.Timestamp(start):%Y-%m-%d}" if start is not None else '',
+              f"{pd.Timestamp(end):%Y-%m-%d}" if end is not None else '9999-12-31'))
+        return history.set_index(pd.DatetimeIndex(history.pop('date'), name='date'))
+    except Exception as e:
+        logger.error(f"Failed to load portfolio history: {str(e)}")
+        return pd.DataFrame(columns=PORTFOLIO_HISTORY_COLUMNS)
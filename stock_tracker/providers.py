@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .bars import latest_session, normalize_bars
+from .config import BAR_COLUMNS, BAR_INTERVALS, MARKET_TZ, METADATA_FIELDS, YF_BATCH_SIZE
+from .metrics import metrics
+from .stock_list import fetch_stock_list
+
+# 資料來源未指定起點時的預設區間：盤中 K 線為最後一個交易日，日 K 線為最近一個月
+def default_window(data, interval):
+    if data.empty:
+        return data
+    if interval == '1m':
+        return latest_session(data)
+    return data[data.index >= data.index[-1] - pd.DateOffset(months=1)]
+
+# 由各檔盤中 K 線整理出最新報價（index 為 symbol，欄位 price / volume / ts）
+def quotes_from_bars(bars_by_symbol):
+    rows = [
+        (symbol, float(data['Close'].iloc[-1]), int(data['Volume'].iloc[-1]), int(data.index.asi8[-1] // 10**9))
+        for symbol, data in bars_by_symbol.items() if not data.empty
+    ]
+    return pd.DataFrame(rows, columns=['symbol', 'price', 'volume', 'ts']).set_index('symbol')
+
+# 行情資料來源介面：報價、盤中 K 線、日 K 線、股票基本資料
+class MarketDataProvider:
+    name = 'base'
+    # 各 K 線週期可回補的最長秒數（未列出者不限）
+    max_lookback = {}
+
+    # 多檔股票的 K 線（start 為 None 時抓取預設區間），回傳 {symbol: K 線}
+    def bars(self, symbols, interval, start=None):
+        raise NotImplementedError
+
+    def intraday_bars(self, symbols, start=None):
+        return self.bars(symbols, '1m', start)
+
+    def daily_bars(self, symbols, start=None):
+        return self.bars(symbols, '1d', start)
+
+    def quotes(self, symbols):
+        return quotes_from_bars(self.intraday_bars(symbols))
+
+    # 股票名稱、昨收、52 週高低（yfinance info 的欄位名稱）
+    def metadata(self, symbol):
+        raise NotImplementedError
+
+    # 上市股票清單（與 fetch_stock_list 相同格式）
+    def stock_list(self):
+        return fetch_stock_list()
+
+# yf.download 的結果暫存在 yfinance 模組層級的共用狀態（shared._DFS），同時呼叫會混到其他批次的資料或卡住，
+# 因此整個程序同一時間只執行一個 yf.download（單次呼叫內部仍以 threads=True 平行下載各檔）
+_download_lock = threading.Lock()
+
+# yfinance 資料來源：多檔股票合併為一次 yf.download 呼叫
+class YFinanceProvider(MarketDataProvider):
+    name = 'yfinance'
+    max_lookback = {'1m': 7 * 24 * 60 * 60}
+
+    def __init__(self, batch_size=YF_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def bars(self, symbols, interval, start=None):
+        import yfinance as yf
+        symbols = sorted(set(symbols))
+        if start is None:
+            kwargs = {'period': BAR_INTERVALS[interval]['period']}
+        else:
+            kwargs = {'start': start}
+        result = {}
+        for i in range(0, len(symbols), self.batch_size):
+            batch = symbols[i:i + self.batch_size]
+            metrics.count('upstream_calls', source='yf.download')
+            with _download_lock, metrics.span('upstream', source='yf.download'):
+                data = yf.download(batch, interval=interval, group_by='ticker', threads=True, progress=False, **kwargs)
+            if data.empty:
+                continue
+            if not isinstance(data.columns, pd.MultiIndex):
+                result[batch[0]] = normalize_bars(data)
+                continue
+            for symbol in batch:
+                if symbol in data.columns.get_level_values(0):
+                    bars = normalize_bars(data[symbol])
+                    if not bars.empty:
+                        result[symbol] = bars
+        return result
+
+    def metadata(self, symbol):
+        import yfinance as yf
+        metrics.count('upstream_calls', source='yf.info')
+        with metrics.span('upstream', source='yf.info'):
+            info = yf.Ticker(symbol).info
+        return {field: info[field] for field in METADATA_FIELDS if field in info}
+
+# 重播檔案路徑：<directory>/<symbol>_<interval>.csv
+def replay_path(directory, symbol, interval):
+    return os.path.join(directory, f"{symbol}_{interval}.csv")
+
+def read_replay_bars(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    data = pd.read_csv(path, index_col=0)
+    data.index = pd.to_datetime(data.index, utc=True)
+    return normalize_bars(data)
+
+# 錄製 K 線到重播檔案（與既有檔案合併，同一時間以新資料為準）
+def save_replay_bars(directory, symbol, interval, data):
+    os.makedirs(directory, exist_ok=True)
+    path = replay_path(directory, symbol, interval)
+    existing = read_replay_bars(path)
+    data = normalize_bars(data)
+    merged = pd.concat([existing, data]) if not existing.empty else data
+    merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+    merged.to_csv(path, index_label='Datetime')
+
+# 產生合成 K 線（隨機漫步，固定種子可重現）：盤中為 09:00–13:29 每分鐘，日線為工作日
+def synthetic_bars(symbol, interval, end, periods, start_price=100.0, seed=None):
+    end = pd.Timestamp(end)
+    end = end.tz_localize(MARKET_TZ) if end.tz is None else end.tz_convert(MARKET_TZ)
+    if interval == '1m':
+        days = pd.bdate_range(end=end.normalize(), periods=periods // 270 + 2)
+        index = pd.DatetimeIndex(np.concatenate([
+            pd.date_range(day + pd.Timedelta(hours=9), periods=270, freq='min').asi8 for day in days
+        ])).tz_localize('UTC').tz_convert(MARKET_TZ)
+        index = index[index <= end][-periods:]
+        sigma = 0.001
+    else:
+        index = pd.bdate_range(end=end.normalize().tz_localize(None), periods=periods).tz_localize(MARKET_TZ)
+        sigma = 0.015
+    rng = np.random.default_rng(zlib.crc32(f"{symbol}:{interval}".encode()) if seed is None else seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, sigma, len(index))))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0, sigma, len(index)))
+    return pd.DataFrame({
+        'Open': open_.round(2),
+        'High': (np.maximum(open_, close) * (1 + spread)).round(2),
+        'Low': (np.minimum(open_, close) * (1 - spread)).round(2),
+        'Close': close.round(2),
+        'Volume': rng.integers(1_000, 500_000, len(index)),
+    }, index=index)
+
+# 離線重播資料來源：從本機 CSV 提供錄製或合成的 K 線（clock 可模擬盤中時間推進）
+class ReplayProvider(MarketDataProvider):
+    name = 'replay'
+
+    def __init__(self, directory, clock=None):
+        self.directory = directory
+        self.clock = clock
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _load(self, symbol, interval):
+        key = (symbol, interval)
+        with self._lock:
+            if key not in self._frames:
+                self._frames[key] = read_replay_bars(replay_path(self.directory, symbol, interval))
+            data = self._frames[key]
+        if self.clock is not None:
+            data = data[data.index <= self.clock()]
+        return data
+
+    def bars(self, symbols, interval, start=None):
+        result = {}
+        for symbol in sorted(set(symbols)):
+            data = self._load(symbol, interval)
+            data = default_window(data, interval) if start is None else data[data.index >= start]
+            if not data.empty:
+                result[symbol] = data
+        return result
+
+    # metadata.json 中未提供的欄位由日 K 線推算
+    def metadata(self, symbol):
+        path = os.path.join(self.directory, 'metadata.json')
+        info = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                info = json.load(f).get(symbol, {})
+        daily = self._load(symbol, '1d').iloc[-252:]
+        if len(daily) >= 2:
+            info.setdefault('regularMarketPreviousClose', float(daily['Close'].iloc[-2]))
+        if not daily.empty:
+            info.setdefault('fiftyTwoWeekHigh', float(daily['High'].max()))
+            info.setdefault('fiftyTwoWeekLow', float(daily['Low'].min()))
+        info.setdefault('longName', symbol)
+        return info
+
+    def stock_list(self):
+        path = os.path.join(self.directory, 'stock_list.csv')
+        if not os.path.exists(path):
+            return []
+        return pd.read_csv(path, dtype=str).fillna('').to_dict('records')
@@ -0,0 +1,106 @@
+import heapq
+
+from .config import FUZZY_SHORTLIST_SIZE
+from .db import get_database, get_metadata, init_database
+from .resources import cached_resource, logger
+
+# 取得名稱的字元 n-gram（單字元 + 雙字元），供模糊查詢建立索引
+def name_ngrams(name):
+    name = name.lower().replace(' ', '')
+    return set(name) | {name[i:i + 2] for i in range(len(name) - 1)}
+
+# 股票代號解析器：代號 / 名稱 / ISIN 對照表與名稱 n-gram 反向索引
+class StockResolver:
+    def __init__(self, rows):
+        self.symbol_to_name = {}
+        self.code_to_symbol = {}
+        self.name_to_symbols = {}
+        self.isin_to_symbol = {}
+        self.ngram_index = {}
+        for code, name, isin, suffix in rows:
+            symbol = f"{code}{suffix or '.TW'}"
+            self.symbol_to_name[symbol] = name
+            self.code_to_symbol[code] = symbol
+            self.name_to_symbols.setdefault(name, []).append(symbol)
+            if isin:
+                self.isin_to_symbol[isin.upper()] = symbol
+        self.ngram_counts = {}
+        for name in self.name_to_symbols:
+            grams = name_ngrams(name)
+            self.ngram_counts[name] = len(grams)
+            for gram in grams:
+                self.ngram_index.setdefault(gram, []).append(name)
+
+    def __len__(self):
+        return len(self.symbol_to_name)
+
+    def name_for(self, symbol, default=None):
+        return self.symbol_to_name.get(symbol, default)
+
+    # 代號（1101 / 1101.TW / 6488.TWO）、ISIN 或完整名稱 → 所有符合的 Yahoo 代號
+    # （同名的上市 / 上櫃股票會有多個代號）
+    def candidates(self, query):
+        query = query.strip()
+        if not query:
+            return []
+        if query.upper() in self.symbol_to_name:
+            return [query.upper()]
+        if query in self.code_to_symbol:
+            return [self.code_to_symbol[query]]
+        if query.upper() in self.isin_to_symbol:
+            return [self.isin_to_symbol[query.upper()]]
+        return list(self.name_to_symbols.get(query, []))
+
+    # 唯一符合的 Yahoo 代號（找不到或名稱對應多個代號時回傳 None，由呼叫端以 candidates 詢問使用者）
+    def resolve(self, query):
+        candidates = self.candidates(query)
+        return candidates[0] if len(candidates) == 1 else None
+
+    # 只對 n-gram 索引篩出的候選名稱計算相似度（依 n-gram 重疊比例排序）
+    def shortlist(self, query, limit=FUZZY_SHORTLIST_SIZE):
+        grams = name_ngrams(query)
+        hits = {}
+        for gram in grams:
+            for name in self.ngram_index.get(gram, ()):
+                hits[name] = hits.get(name, 0) + 1
+        scores = {name: 2 * n / (len(grams) + self.ngram_counts[name]) for name, n in hits.items()}
+        return heapq.nlargest(limit, scores, key=scores.get)
+
+    # 回傳（最相近名稱的所有代號, 相似名稱清單）；相似度不足時代號清單為空
+    def fuzzy_search(self, query, limit=3):
+        from fuzzywuzzy import process
+        candidates = self.shortlist(query)
+        if not candidates:
+            return [], []
+        matches = process.extract(query, candidates, limit=limit)
+        if matches and matches[0][1] > 80:  # 匹配度 > 80%
+            return list(self.name_to_symbols[matches[0][0]]), matches
+        return [], matches
+
+# 建立解析器（以股票清單雜湊值為快取鍵，清單變動時才重建）
+@cached_resource(max_entries=4)
+def _build_resolver(db_path, stock_list_hash):
+    return StockResolver(get_database(db_path).query("SELECT code, name, isin, suffix FROM stock_list ORDER BY code"))
+
+# 取得目前股票清單對應的解析器
+def get_resolver(db_path):
+    try:
+        init_database(db_path)
+        with get_database(db_path).connection() as conn:
+            stock_list_hash = get_metadata(conn, 'stock_list_hash', '')
+        return _build_resolver(db_path, stock_list_hash)
+    except Exception as e:
+        logger.error(f"Failed to load stock list: {str(e)}")
+        return StockResolver([])
+
+# 檢查機制 1：標準化與驗證股票代碼（名稱對應多個代號時回傳 None）
+def validate_stock_code(query, db_path):
+    return get_resolver(db_path).resolve(query)
+
+# 輸入對應的所有代號（供名稱重複時讓使用者選擇）
+def stock_candidates(query, db_path):
+    return get_resolver(db_path).candidates(query)
+
+# 檢查機制 2：模糊查詢股票名稱
+def fuzzy_search_name(query, db_path):
+    return get_resolver(db_path).fuzzy_search(query)
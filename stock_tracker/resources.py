@@ -0,0 +1,38 @@
+import functools
+import logging
+import threading
+from collections import OrderedDict
+
+# 核心模組的錯誤訊息（app.py 顯示在頁面上，命令列輸出到 stderr）
+logger = logging.getLogger('stock_tracker')
+
+# 程序內共用資源：依參數快取函式的回傳值，同一組參數只建立一次（取代 st.cache_resource）；
+# 每組參數各有一把鎖，建立中的資源不會擋住其他參數；max_entries 為上限，超過時淘汰最久未使用的項目
+def cached_resource(func=None, max_entries=None):
+    if func is None:
+        return functools.partial(cached_resource, max_entries=max_entries)
+    entries = OrderedDict()
+    locks = {}
+    guard = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        with guard:
+            if args in entries:
+                entries.move_to_end(args)
+                return entries[args]
+            lock = locks.setdefault(args, threading.Lock())
+        with lock:
+            with guard:
+                if args in entries:
+                    return entries[args]
+            value = func(*args)
+            with guard:
+                entries[args] = value
+                locks.pop(args, None)
+                while max_entries is not None and len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return value
+
+    wrapper.clear = entries.clear
+    return wrapper
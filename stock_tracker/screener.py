@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from .bars import sync_many
+from .config import (
+    SCREENER_HISTORY_DAYS, SCREENER_LIMIT, SCREENER_RETURN_WINDOWS, SCREENER_RSI_WINDOW, SCREENER_SMA_WINDOWS,
+    SCREENER_SORT_COLUMNS, SCREENER_VOLUME_WINDOW, SCREENER_YEAR_BARS, YF_BATCH_SIZE,
+)
+from .db import get_database, get_metadata, init_database
+from .metrics import metrics, timed
+from .resources import cached_resource, logger
+
+# 選股器：全市場日 K 線整理為（交易日 × 股票）的二維陣列，所有指標以陣列運算一次算完
+
+# 股票清單中的股票（可依產業別 / 市場別篩選），回傳 symbol 為索引的名稱、市場別與產業別
+def market_listing(db_path, industries=None, markets=None):
+    init_database(db_path)
+    listing = get_database(db_path).query_df("SELECT code, name, market, industry, suffix FROM stock_list ORDER BY code")
+    listing.index = pd.Index(listing.pop('code') + listing.pop('suffix').fillna('.TW'), name='symbol')
+    if industries:
+        listing = listing[listing['industry'].isin(industries)]
+    if markets:
+        listing = listing[listing['market'].isin(markets)]
+    return listing
+
+# 股票清單中的市場別與產業別（供篩選選單使用）
+def screen_filters(db_path):
+    listing = market_listing(db_path)
+    return [sorted(value for value in listing[column].dropna().unique() if value) for column in ('market', 'industry')]
+
+# 同步多檔股票的日 K 線：每批 YF_BATCH_SIZE 檔依序抓取（yf.download 不能同時呼叫，
+# 單批內已由 yfinance 平行下載），確保至少有 history_days 天的歷史；progress(完成批數, 總批數) 回報進度。
+# 回傳有 K 線的股票數，失敗的批次只記錄錯誤、不中斷其他批次
+@timed('screener.sync')
+def sync_market(db_path, provider, symbols, history_days=SCREENER_HISTORY_DAYS, progress=None):
+    init_database(db_path)
+    batches = [symbols[i:i + YF_BATCH_SIZE] for i in range(0, len(symbols), YF_BATCH_SIZE)]
+    synced = 0
+    for done, batch in enumerate(batches, 1):
+        try:
+            synced += sum(not bars.empty for bars in sync_many(db_path, batch, '1d', provider, history_days * 24 * 60 * 60).values())
+        except Exception as e:
+            metrics.count('screener_sync_errors')
+            logger.error(f"Failed to sync market data: {str(e)}")
+        if progress is not None:
+            progress(done, len(batches))
+    return synced
+
+# 以單一查詢讀取最後一個交易日往回 days 天的日 K 線，整理為（交易日 × 股票）的二維陣列；
+# 當天沒有 K 線的格子為 NaN
+@timed('screener.panel')
+def load_panel(db_path, days=SCREENER_HISTORY_DAYS):
+    rows = get_database(db_path).query_df('''
+        SELECT symbol, ts, high, low, close, volume FROM stock_data
+        WHERE interval = '1d' AND ts >= (SELECT MAX(ts) FROM stock_data WHERE interval = '1d') - ?
+    ''', (days * 24 * 60 * 60,))
+    symbols, col = np.unique(rows['symbol'].to_numpy(dtype=str), return_inverse=True)
+    dates, row = np.unique(rows['ts'].to_numpy(dtype=np.int64), return_inverse=True)
+    panel = {'index': pd.to_datetime(dates, unit='s', utc=True), 'symbols': symbols}
+    for field in ('high', 'low', 'close', 'volume'):
+        values = np.full((len(dates), len(symbols)), np.nan)
+        values[row, col] = rows[field].to_numpy(dtype=float)
+        panel[field] = values
+    return panel
+
+# 全市場指標：收盤價以前值補齊停牌日，報酬率 / 均線 / RSI / 量比 / 52 週高低點皆為整個陣列的向量運算
+@timed('screener.compute')
+def compute_screen(panel):
+    close = pd.DataFrame(panel['close']).ffill().to_numpy()
+    result = pd.DataFrame(index=pd.Index(panel['symbols'], name='symbol'))
+    if len(close) == 0:
+        return result
+    last = close[-1]
+    result['close'] = last
+    result['bars'] = np.count_nonzero(~np.isnan(panel['close']), axis=0)
+    for window in [1] + SCREENER_RETURN_WINDOWS:
+        name = 'change_pct' if window == 1 else f"return_{window}d"
+        result[name] = (last / close[-1 - window] - 1) * 100 if len(close) > window else np.nan
+    for window in SCREENER_SMA_WINDOWS:
+        sma = close[-window:].mean(axis=0) if len(close) >= window else np.full(len(last), np.nan)
+        result[f"sma_{window}"] = sma
+        result[f"sma_{window}_gap"] = (last / sma - 1) * 100
+    # RSI：漲跌幅以 Wilder 平滑（alpha = 1 / window，同 ta.momentum.RSIIndicator）；
+    # 與 ta 相同，每檔股票第一個收盤價的漲跌幅為 0（作為平滑的起始值）
+    delta = np.diff(close, axis=0, prepend=np.nan)
+    delta[np.isnan(delta) & ~np.isnan(close)] = 0.0
+    delta = pd.DataFrame(delta)
+    smoothing = dict(alpha=1 / SCREENER_RSI_WINDOW, adjust=False, min_periods=SCREENER_RSI_WINDOW)
+    gain = delta.clip(lower=0).ewm(**smoothing).mean().to_numpy()[-1]
+    loss = (-delta).clip(lower=0).ewm(**smoothing).mean().to_numpy()[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[f"rsi_{SCREENER_RSI_WINDOW}"] = np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+    # 量比：最後一天成交量 / 之前 SCREENER_VOLUME_WINDOW 天的平均成交量
+    volume = pd.DataFrame(panel['volume'])
+    result['volume'] = panel['volume'][-1]
+    result['volume_ratio'] = result['volume'].to_numpy() / volume.iloc[-1 - SCREENER_VOLUME_WINDOW:-1].mean().to_numpy()
+    high = pd.DataFrame(panel['high'][-SCREENER_YEAR_BARS:]).max().to_numpy()
+    low = pd.DataFrame(panel['low'][-SCREENER_YEAR_BARS:]).min().to_numpy()
+    result['high_52w'] = high
+    result['low_52w'] = low
+    result['from_high_pct'] = (last / high - 1) * 100
+    result['new_high'] = panel['high'][-1] >= high
+    result['new_low'] = panel['low'][-1] <= low
+    return result.replace([np.inf, -np.inf], np.nan)
+
+# 全市場指標快取（version 為日 K 線變動計數，同步或匯入日 K 線後才重新計算）
+@cached_resource(max_entries=4)
+def _screen_table(db_path, version):
+    return compute_screen(load_panel(db_path))
+
+# 選股：依產業別 / 市場別篩選股票清單，依 sort_by 欄位排序並取前 limit 筆（沒有日 K 線的股票不列出）
+def screen(db_path, industries=None, markets=None, sort_by=SCREENER_SORT_COLUMNS[0], ascending=False, limit=SCREENER_LIMIT):
+    try:
+        listing = market_listing(db_path, industries, markets)
+        with get_database(db_path).connection() as conn:
+            version = get_metadata(conn, 'daily_bars_version', 0)
+        table = _screen_table(db_path, version)
+        if table.empty:
+            return pd.DataFrame()
+        result = listing.join(table, how='inner')
+        result = result.sort_values(sort_by, ascending=ascending, na_position='last', kind='stable')
+        return result.head(limit).reset_index()
+    except Exception as e:
+        logger.error(f"Failed to screen stocks: {str(e)}")
+        return pd.DataFrame()
@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from .bars import get_bar_store
+from .config import BAR_COLUMNS, MARKET_TZ, SNAPSHOT_DIR_SUFFIX, SNAPSHOT_DOWNLOAD_INTERVAL, SNAPSHOT_FIELDS, SNAPSHOT_URL
+from .db import bump_daily_bars_version, get_database, init_database, mark_portfolio_history_dirty
+from .metrics import metrics, timed
+from .resources import logger
+
+# 每日收盤行情：TWSE 全部股票的單日 OHLCV 檔案（MI_INDEX 的 CSV / JSON，或 OpenAPI STOCK_DAY_ALL 的 JSON），
+# 檔名含交易日（YYYYMMDD）；每個檔案在單一交易中寫入 stock_data 的日 K 線，並記錄在 snapshot_files
+
+# 檔名中的交易日與格式
+SNAPSHOT_NAME = re.compile(r'(\d{8})\.(csv|json)$', re.IGNORECASE)
+
+# 下載快取目錄（與資料庫檔案放在同一目錄）
+def snapshot_dir(db_path):
+    return os.path.splitext(os.path.abspath(db_path))[0] + SNAPSHOT_DIR_SUFFIX
+
+def snapshot_path(directory, date, ext='json'):
+    return os.path.join(directory, f"MI_INDEX_{date:%Y%m%d}.{ext}")
+
+# 目錄中的每日收盤行情檔案 {YYYYMMDD: 路徑}（同一天同時有 CSV 與 JSON 時使用 JSON）
+def list_snapshots(directory):
+    files = {}
+    if not os.path.isdir(directory):
+        return files
+    for name in sorted(os.listdir(directory)):
+        match = SNAPSHOT_NAME.search(name)
+        if match and (match.group(1) not in files or match.group(2).lower() == 'json'):
+            files[match.group(1)] = os.path.join(directory, name)
+    return files
+
+# 是否為個股行情表格（有證券代號與收盤價欄位）
+def _is_quote_table(fields):
+    return {'code', 'Close'} <= {SNAPSHOT_FIELDS.get(str(field).strip()) for field in fields}
+
+# 從 JSON 內容找出個股行情表格，回傳 (欄位, 資料列)：新版為 tables 陣列，舊版為 fields9 / data9 等成對欄位，
+# OpenAPI 為物件陣列；沒有資料（休市日）時回傳空表格
+def _json_table(payload):
+    if isinstance(payload, list):
+        fields = list(payload[0]) if payload else []
+        return fields, [[row.get(field) for field in fields] for row in payload]
+    tables = list(payload.get('tables') or [])
+    tables += [{'fields': payload[key], 'data': payload.get('data' + key[len('fields'):])}
+               for key in payload if key.startswith('fields')]
+    for table in tables:
+        if _is_quote_table(table.get('fields') or []):
+            return table['fields'], table.get('data') or []
+    return [], []
+
+# 從 CSV 內容找出個股行情表格（MI_INDEX 的 CSV 含多個表格，個股行情以空白列或備註結束）
+def _csv_table(text):
+    fields = None
+    rows = []
+    for row in csv.reader(io.StringIO(text)):
+        row = [cell.strip() for cell in row]
+        if fields is None:
+            if _is_quote_table(row):
+                fields = row
+        elif len(row) >= len(fields) and row[0]:
+            rows.append(row)
+        else:
+            break
+    return fields or [], rows
+
+# 解析單日檔案：代號轉為 Yahoo 代號（XXXX.TW），去除千分位與未成交（--）的股票，回傳以 symbol 為索引的 OHLCV
+@timed('snapshots.parse')
+def parse_snapshot(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = raw.decode('cp950', errors='replace')  # TWSE 下載的 CSV 為 Big5 編碼
+    fields, rows = _json_table(json.loads(text)) if path.lower().endswith('.json') else _csv_table(text)
+    positions = {SNAPSHOT_FIELDS[str(field).strip()]: i for i, field in enumerate(fields) if str(field).strip() in SNAPSHOT_FIELDS}
+    if not rows or not set(BAR_COLUMNS + ['code']) <= positions.keys():
+        return pd.DataFrame(columns=BAR_COLUMNS, index=pd.Index([], name='symbol'))
+    frame = pd.DataFrame({name: [row[i] for row in rows] for name, i in positions.items()}, dtype=str)
+    # CSV 以 ="0050" 保留代號前面的 0
+    codes = frame.pop('code').str.strip().str.strip('="')
+    frame = frame.apply(lambda column: pd.to_numeric(column.str.replace(',', ''), errors='coerce'))
+    frame = frame[codes.str.fullmatch(r'[0-9A-Z]{4,6}').to_numpy() & frame['Close'].notna().to_numpy()]
+    frame.index = pd.Index(codes[frame.index] + '.TW', name='symbol')
+    for column in ('Open', 'High', 'Low'):
+        frame[column] = frame[column].fillna(frame['Close'])
+    frame['Volume'] = frame['Volume'].fillna(0).astype('int64')
+    return frame[BAR_COLUMNS]
+
+# 匯入單日檔案：所有股票的日 K 線與檔案紀錄在同一個交易中寫入（中斷時整個檔案不算匯入，重新執行即可續傳）
+@timed('snapshots.ingest')
+def ingest_snapshot(db_path, path):
+    date = SNAPSHOT_NAME.search(os.path.basename(path)).group(1)
+    quotes = parse_snapshot(path)
+    # 日 K 線時間與 yfinance 相同：交易日 00:00（台股時區）
+    ts = int(pd.Timestamp(date).tz_localize(MARKET_TZ).timestamp())
+    rows = list(zip(
+        quotes.index.tolist(),
+        ['1d'] * len(quotes),
+        [ts] * len(quotes),
+        quotes['Open'].tolist(),
+        quotes['High'].tolist(),
+        quotes['Low'].tolist(),
+        quotes['Close'].tolist(),
+        quotes['Volume'].tolist(),
+    ))
+    stat = os.stat(path)
+    with get_database(db_path).transaction() as conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO stock_data (symbol, interval, ts, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.execute('''
+            INSERT OR REPLACE INTO snapshot_files (date, path, size, mtime_ns, rows, ingested_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (date, os.path.abspath(path), stat.st_size, stat.st_mtime_ns, len(rows), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        # 補匯入過去的收盤價時，投資組合歷史從該日起重算
+        mark_portfolio_history_dirty(conn, f"{date[:4]}-{date[4:6]}-{date[6:]}")
+        bump_daily_bars_version(conn)
+    metrics.count('rows_written', len(rows), table='stock_data')
+    return len(rows)
+
+# 從 TWSE 下載單日檔案到快取目錄（先寫暫存檔再替換）；當天尚未公布時回傳 None 且不快取，
+# 過去的日期沒有資料即為休市日，仍保留檔案避免重複下載
+def download_snapshot(date, directory):
+    import requests
+    date = pd.Timestamp(date)
+    metrics.count('upstream_calls', source='twse')
+    with metrics.span('upstream', source='twse'):
+        response = requests.get(SNAPSHOT_URL.format(date=f"{date:%Y%m%d}"), timeout=30)
+    response.raise_for_status()
+    payload = response.json()
+    if not _json_table(payload)[1] and date >= pd.Timestamp.now(tz=MARKET_TZ).normalize().tz_localize(None):
+        return None
+    path = snapshot_path(directory, date)
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    return path
+
+# 依序匯入目錄中的每日收盤行情（start / end 為日期範圍，未指定時匯入目錄中所有檔案）；
+# 已匯入且檔案未變更者略過，download 時缺少的交易日先從 TWSE 下載（下載失敗即停止，之後重新執行可續傳）。
+# progress(完成天數, 總天數) 回報進度；回傳 {'files', 'rows', 'skipped', 'missing'}
+@timed('snapshots.ingest_range')
+def ingest_snapshots(db_path, directory=None, start=None, end=None, download=False, progress=None):
+    init_database(db_path)
+    directory = directory or snapshot_dir(db_path)
+    files = list_snapshots(directory)
+    if start is None and end is None:
+        dates = sorted(files)
+    else:
+        start = pd.Timestamp(start if start is not None else min(files, default='today')).normalize()
+        end = pd.Timestamp(end if end is not None else 'today').normalize()
+        # 週一至週五之外，目錄中已有的檔案（如週六補行交易日）也一併匯入
+        dates = sorted({f"{day:%Y%m%d}" for day in pd.bdate_range(start, end)} |
+                       {key for key in files if f"{start:%Y%m%d}" <= key <= f"{end:%Y%m%d}"})
+    ingested = {row[0]: (row[1], row[2]) for row in get_database(db_path).query("SELECT date, size, mtime_ns FROM snapshot_files")}
+    result = {'files': 0, 'rows': 0, 'skipped': 0, 'missing': []}
+    last_download = None
+    for done, date in enumerate(dates, 1):
+        path = files.get(date)
+        if path is None and download:
+            if last_download is not None:
+                time.sleep(max(0, last_download + SNAPSHOT_DOWNLOAD_INTERVAL - time.monotonic()))
+            last_download = time.monotonic()
+            try:
+                path = download_snapshot(date, directory)
+            except Exception as e:
+                logger.error(f"Failed to download daily quotes for {date}: {str(e)}")
+                result['missing'].extend(dates[done - 1:])
+                break
+        if path is None:
+            result['missing'].append(date)
+        else:
+            stat = os.stat(path)
+            if ingested.get(date) == (stat.st_size, stat.st_mtime_ns):
+                result['skipped'] += 1
+            else:
+                try:
+                    result['rows'] += ingest_snapshot(db_path, path)
+                    result['files'] += 1
+                except Exception as e:
+                    metrics.count('snapshot_errors')
+                    logger.error(f"Failed to ingest {path}: {str(e)}")
+        if progress is not None:
+            progress(done, len(dates))
+    if result['files']:
+        get_bar_store().invalidate(db_path, '1d')
+    return result
@@ -0,0 +1,144 @@
+import codecs
+import hashlib
+import html
+import json
+import re
+import threading
+import time
+
+from .config import ISIN_CHUNK_SIZE, ISIN_ENCODING, ISIN_MODES, ISIN_URL, STOCK_LIST_RETRY_INTERVAL, STOCK_LIST_TTL
+from .db import get_database, get_metadata, init_database, set_metadata
+from .metrics import metrics, timed
+from .resources import cached_resource, logger
+
+# ISIN 頁面的資料列、儲存格與分類標題（頁面由 TWSE 程式產生、結構固定，逐列比對即可，不需建立完整的 DOM）
+ISIN_ROW = re.compile(r'<tr[^>]*>(.*?)</tr>', re.IGNORECASE | re.DOTALL)
+ISIN_CELL = re.compile(r'<td[^>]*>(.*?)</td>', re.IGNORECASE | re.DOTALL)
+ISIN_CATEGORY = re.compile(r'<b>', re.IGNORECASE)
+HTML_TAG = re.compile(r'<[^>]*>')
+
+# 將下載的位元組片段逐段解碼（多位元組字元跨片段時由增量解碼器接續）
+def decode_chunks(chunks, encoding=ISIN_ENCODING):
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+# 逐列解析 ISIN 頁面：chunks 為已解碼的文字片段（或整頁字串），每湊齊一列就輸出，記憶體中只保留尚未結束的一列；
+# 只輸出該 strMode 納入的分類，並標記分類與 Yahoo 代號後綴
+def iter_stock_list(chunks, mode=2):
+    spec = ISIN_MODES[mode]
+    category = None
+    buffer = ''
+    for chunk in [chunks] if isinstance(chunks, str) else chunks:
+        buffer += chunk
+        end = 0
+        for match in ISIN_ROW.finditer(buffer):
+            end = match.end()
+            row = match.group(1)
+            if ISIN_CATEGORY.search(row):  # 分類標題（如「股票」）
+                category = HTML_TAG.sub('', row).strip()
+                continue
+            if category not in spec['categories']:
+                continue
+            cols = [html.unescape(HTML_TAG.sub('', cell)).strip().replace('\u3000', ' ') for cell in ISIN_CELL.findall(row)]
+            if len(cols) >= 7:
+                code, _, name = cols[0].partition(' ')
+                yield {
+                    'code': code,
+                    'name': name.strip(),
+                    'isin': cols[1],
+                    'date_listed': cols[2],
+                    'market': cols[3],
+                    'industry': cols[4],
+                    'cficode': cols[5],
+                    'category': category,
+                    'suffix': spec['suffix'],
+                }
+        buffer = buffer[end:]
+
+# 解析 ISIN 頁面（整頁字串或文字片段）
+@timed('stock_list.parse')
+def parse_stock_list(chunks, mode=2):
+    return list(iter_stock_list(chunks, mode))
+
+# 串流下載並解析單一 strMode 的 ISIN 頁面（不保留整頁內容）
+def fetch_isin_page(mode):
+    import requests
+    metrics.count('upstream_calls', source='twse')
+    with metrics.span('upstream', source='twse'), \
+            requests.get(ISIN_URL.format(mode=mode), verify=False, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        stock_list = parse_stock_list(decode_chunks(response.iter_content(ISIN_CHUNK_SIZE)), mode)
+    if not stock_list:
+        raise ValueError(f"no stocks found on the ISIN page (strMode={mode})")
+    return stock_list
+
+# 從 TWSE 網站抓取股票清單（上市與上櫃；任一頁面失敗即視為抓取失敗，避免以不完整的清單取代舊清單）
+def fetch_stock_list(modes=tuple(ISIN_MODES)):
+    try:
+        stock_list = []
+        for mode in modes:
+            stock_list.extend(fetch_isin_page(mode))
+        return stock_list
+    except Exception as e:
+        logger.error(f"Failed to fetch stock list: {str(e)}")
+        return []
+
+# 股票清單更新鎖（同一程序內只允許一個 session 抓取 TWSE）
+@cached_resource
+def _stock_list_lock():
+    return threading.Lock()
+
+# 更新股票清單：超過 TTL 或手動要求時才重新抓取，抓取失敗則沿用上次成功的清單；
+# 其他 session 正在抓取時不等待，直接沿用目前的清單
+def refresh_stock_list(db_path, ttl=STOCK_LIST_TTL, force=False, fetch=fetch_stock_list):
+    init_database(db_path)
+    lock = _stock_list_lock()
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        db = get_database(db_path)
+        now = time.time()
+        with db.connection() as conn:
+            fetched_at = float(get_metadata(conn, 'stock_list_fetched_at', 0))
+            failed_at = float(get_metadata(conn, 'stock_list_failed_at', 0))
+        if not force and (now - fetched_at < ttl or now - failed_at < STOCK_LIST_RETRY_INTERVAL):
+            return False
+        stock_list = fetch()
+        if not stock_list:
+            with db.transaction() as conn:
+                set_metadata(conn, 'stock_list_failed_at', now)
+            return False
+        # 未標記分類與後綴的清單（如離線重播的 stock_list.csv）視為上市股票
+        rows = sorted(
+            (s['code'], s['name'], s['isin'], s['date_listed'], s['market'], s['industry'], s['cficode'],
+             s.get('category') or '股票', s.get('suffix') or '.TW')
+            for s in stock_list
+        )
+        digest = hashlib.sha256(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+        with db.transaction() as conn:
+            if digest != get_metadata(conn, 'stock_list_hash'):
+                conn.execute("DELETE FROM stock_list")
+                conn.executemany('''
+                    INSERT INTO stock_list (code, name, isin, date_listed, market, industry, cficode, category, suffix)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                set_metadata(conn, 'stock_list_hash', digest)
+                metrics.count('rows_written', len(rows), table='stock_list')
+            set_metadata(conn, 'stock_list_fetched_at', now)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to refresh stock list: {str(e)}")
+        return False
+    finally:
+        lock.release()
+
+# 從資料庫載入股票清單
+def load_stock_list(db_path):
+    try:
+        init_database(db_path)
+        return dict(get_database(db_path).query("SELECT code, name FROM stock_list"))
+    except Exception as e:
+        logger.error(f"Failed to load stock list: {str(e)}")
+        return {}
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_tracker.db import init_database
+from stock_tracker.indicators import IndicatorEngine, reference_indicators
+from stock_tracker.providers import synthetic_bars
+
+SPECS = ['sma:5', 'sma:20', 'ema:12', 'rsi:14', 'macd:26:12:9', 'bb:20:2']
+
+# 串流指標逐批推進（每次只多幾根 K 線，最後一根為暫定值），結果應與 ta 整批重算相同
+@pytest.mark.parametrize('step', [1, 7, 50])
+def test_streaming_indicators_match_ta(tmp_path, step):
+    db_path = str(tmp_path / 'stock_data.db')
+    init_database(db_path)
+    bars = synthetic_bars('2330.TW', '1d', '2024-10-01', 120, start_price=500.0)
+    engine = IndicatorEngine(SPECS)
+    for end in range(step, len(bars) + step, step):
+        streamed = engine.advance(db_path, '2330.TW', '1d', bars.iloc[:end])
+    expected = reference_indicators(bars['Close'], SPECS)
+    assert list(streamed.index) == list(bars.index)
+    pd.testing.assert_frame_equal(streamed[expected.columns], expected, check_freq=False, atol=1e-9, rtol=0)
+
+# 重新啟動（新的引擎從 indicator_state 載入狀態）後繼續推進，結果不變
+def test_indicator_state_survives_restart(tmp_path):
+    db_path = str(tmp_path / 'stock_data.db')
+    init_database(db_path)
+    bars = synthetic_bars('1101.TW', '1d', '2024-10-01', 80, start_price=40.0)
+    IndicatorEngine(SPECS).advance(db_path, '1101.TW', '1d', bars.iloc[:60])
+    streamed = IndicatorEngine(SPECS).advance(db_path, '1101.TW', '1d', bars.iloc[59:])
+    expected = reference_indicators(bars['Close'], SPECS)
+    assert np.allclose(streamed[expected.columns].to_numpy(), expected.to_numpy(), atol=1e-9, equal_nan=True)
@@ -0,0 +1,132 @@
+import pandas as pd
+import pytest
+
+from stock_tracker.bars import save_bars
+from stock_tracker.db import get_database, get_metadata, init_database
+from stock_tracker.portfolio import (add_to_portfolio, compute_portfolio_history, save_portfolio_changes,
+                                     update_portfolio_history)
+from stock_tracker.providers import synthetic_bars
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'stock_data.db')
+    init_database(db_path)
+    return db_path
+
+def positions(db_path):
+    return get_database(db_path).query_df("SELECT symbol, quantity, total_cost FROM portfolio ORDER BY symbol")
+
+def ledger(db_path, symbol):
+    return get_database(db_path).query_df('''
+        SELECT purchase_price, quantity FROM purchase_history WHERE symbol = ? ORDER BY id
+    ''', (symbol,))
+
+# 買進：持股數量與總成本由觸發程序從交易紀錄累計
+def test_buy_accumulates_quantity_and_cost(db_path):
+    add_to_portfolio(db_path, '2330.TW', '台積電', 1000, 500.0, '2024-10-01')
+    add_to_portfolio(db_path, '2330.TW', '台積電', 500, 530.0, '2024-10-15')
+    portfolio = positions(db_path)
+    assert portfolio['symbol'].tolist() == ['2330.TW']
+    assert portfolio.at[0, 'quantity'] == 1500
+    assert portfolio.at[0, 'total_cost'] == pytest.approx(1000 * 500.0 + 500 * 530.0)
+
+# 部分賣出：表格修改數量寫成一筆以平均成本計價的交易紀錄，總成本依比例減少；重複套用不再寫入
+def test_partial_sell_writes_ledger_row_at_average_cost(db_path):
+    add_to_portfolio(db_path, '2330.TW', '台積電', 1000, 500.0, '2024-10-01')
+    add_to_portfolio(db_path, '2330.TW', '台積電', 1000, 600.0, '2024-10-15')
+    portfolio = positions(db_path)
+    changes = {'edited_rows': {0: {'quantity': 500}}}
+    assert save_portfolio_changes(db_path, portfolio, changes) == 1
+    sell = ledger(db_path, '2330.TW').iloc[-1]
+    assert sell['quantity'] == -1500
+    assert sell['purchase_price'] == pytest.approx(550.0)
+    portfolio = positions(db_path)
+    assert portfolio.at[0, 'quantity'] == 500
+    assert portfolio.at[0, 'total_cost'] == pytest.approx(500 * 550.0)
+    assert save_portfolio_changes(db_path, portfolio, changes) == 0
+    assert len(ledger(db_path, '2330.TW')) == 3
+
+# 全部賣出：刪除列即設為 0 股，持股從投資清單移除，其他股票不受影響
+def test_sell_to_zero_removes_position(db_path):
+    add_to_portfolio(db_path, '1101.TW', '台泥', 2000, 40.0, '2024-10-01')
+    add_to_portfolio(db_path, '2330.TW', '台積電', 1000, 500.0, '2024-10-01')
+    portfolio = positions(db_path)
+    assert save_portfolio_changes(db_path, portfolio, {'deleted_rows': [0]}) == 1
+    assert ledger(db_path, '1101.TW')['quantity'].sum() == 0
+    portfolio = positions(db_path)
+    assert portfolio['symbol'].tolist() == ['2330.TW']
+    assert portfolio.at[0, 'total_cost'] == pytest.approx(1000 * 500.0)
+
+def history(db_path):
+    return get_database(db_path).query_df("SELECT date, cost, value, profit_loss FROM portfolio_totals ORDER BY date")
+
+def dirty(db_path):
+    with get_database(db_path).connection() as conn:
+        return get_metadata(conn, 'portfolio_history_dirty')
+
+# 每日歷史：停牌日沿用前一個收盤價，沒有收盤價的持股以成本計價，交易紀錄從當天起計入
+def test_compute_portfolio_history():
+    ledger = pd.DataFrame({
+        'symbol': ['A', 'B', 'C'],
+        'date': ['2024-10-01', '2024-10-02', '2024-10-01'],
+        'quantity': [10, 2, 1],
+        'cost': [50.0, 20.0, 30.0],
+    })
+    closes = pd.DataFrame({
+        'symbol': ['A', 'B', 'A'],
+        'date': ['2024-10-01', '2024-10-02', '2024-10-03'],
+        'close': [6.0, 11.0, 7.0],
+    })
+    previous = pd.DataFrame({'symbol': ['A', 'B', 'C'], 'close': [4.0, None, None]})
+    positions, totals = compute_portfolio_history(ledger, closes, previous)
+    assert positions == [
+        ('2024-10-01', 'A', 10, 50.0, 6.0, 60.0),
+        ('2024-10-01', 'C', 1, 30.0, None, 30.0),
+        ('2024-10-02', 'A', 10, 50.0, 6.0, 60.0),
+        ('2024-10-02', 'B', 2, 20.0, 11.0, 22.0),
+        ('2024-10-02', 'C', 1, 30.0, None, 30.0),
+        ('2024-10-03', 'A', 10, 50.0, 7.0, 70.0),
+        ('2024-10-03', 'B', 2, 20.0, 11.0, 22.0),
+        ('2024-10-03', 'C', 1, 30.0, None, 30.0),
+    ]
+    assert totals == [
+        ('2024-10-01', 80.0, 90.0, 10.0),
+        ('2024-10-02', 100.0, 112.0, 12.0),
+        ('2024-10-03', 100.0, 122.0, 22.0),
+    ]
+
+# 補登過去日期的購買紀錄：標記該日為重算起點，增量更新的結果與從頭計算相同；沒有變動時不重算
+def test_back_dated_purchase_recomputes_from_its_date(db_path):
+    save_bars(db_path, {'2330.TW': synthetic_bars('2330.TW', '1d', '2024-10-31', 30, start_price=500.0)}, '1d')
+    add_to_portfolio(db_path, '2330.TW', '台積電', 1000, 500.0, '2024-10-15')
+    assert update_portfolio_history(db_path) == 13
+    assert dirty(db_path) is None
+    assert update_portfolio_history(db_path) == 0
+    add_to_portfolio(db_path, '2330.TW', '台積電', 1000, 480.0, '2024-10-01')
+    assert dirty(db_path) == '2024-10-01'
+    assert update_portfolio_history(db_path) == 23
+    incremental = history(db_path)
+    assert incremental['date'].iloc[0] == '2024-10-01'
+    assert incremental.set_index('date').at['2024-10-14', 'cost'] == pytest.approx(1000 * 480.0)
+    assert incremental.set_index('date').at['2024-10-15', 'cost'] == pytest.approx(1000 * 480.0 + 1000 * 500.0)
+    update_portfolio_history(db_path, rebuild=True)
+    pd.testing.assert_frame_equal(history(db_path), incremental)
+
+# 持股的日 K 線更新（例如盤中最後一根收盤價變動）才標記重算，只重算受影響的日期
+def test_daily_bar_update_for_held_symbol_marks_history_dirty(db_path):
+    bars = synthetic_bars('1101.TW', '1d', '2024-10-31', 30, start_price=40.0)
+    save_bars(db_path, {'1101.TW': bars}, '1d')
+    add_to_portfolio(db_path, '1101.TW', '台泥', 1000, 40.0, '2024-10-01')
+    update_portfolio_history(db_path)
+    before = history(db_path)
+    save_bars(db_path, {'2330.TW': synthetic_bars('2330.TW', '1d', '2024-10-31', 30, start_price=500.0)}, '1d')
+    assert dirty(db_path) is None
+    assert update_portfolio_history(db_path) == 0
+    save_bars(db_path, {'1101.TW': bars.iloc[-1:].assign(Close=45.0)}, '1d')
+    assert dirty(db_path) == '2024-10-31'
+    assert update_portfolio_history(db_path) == 1
+    after = history(db_path)
+    pd.testing.assert_frame_equal(after.iloc[:-1], before.iloc[:-1])
+    assert after['value'].iloc[-1] == pytest.approx(1000 * 45.0)
+    assert after['profit_loss'].iloc[-1] == pytest.approx(1000 * (45.0 - 40.0))
@@ -0,0 +1,48 @@
+from stock_tracker.resolver import StockResolver, get_resolver, stock_candidates, validate_stock_code
+from stock_tracker.stock_list import refresh_stock_list
+
+# 上市與上櫃各有一檔同名股票（名稱查詢有兩個代號），另有一檔名稱唯一的股票
+ROWS = [
+    ('1101', '台泥', 'TW0001101004', '.TW'),
+    ('2330', '台積電', 'TW0002330008', '.TW'),
+    ('6488', '環球晶', 'TW0006488000', '.TWO'),
+    ('8888', '台泥', 'TW0008888000', '.TWO'),
+]
+
+def test_duplicate_names_are_ambiguous():
+    resolver = StockResolver(ROWS)
+    assert resolver.candidates('台泥') == ['1101.TW', '8888.TWO']
+    assert resolver.resolve('台泥') is None
+    assert resolver.name_for('8888.TWO') == '台泥'
+
+def test_codes_isins_and_unique_names_resolve_exactly():
+    resolver = StockResolver(ROWS)
+    assert resolver.resolve('1101') == '1101.TW'
+    assert resolver.resolve('8888') == '8888.TWO'
+    assert resolver.resolve('6488.two') == '6488.TWO'
+    assert resolver.resolve('tw0008888000') == '8888.TWO'
+    assert resolver.resolve(' 台積電 ') == '2330.TW'
+    assert resolver.resolve('台塑') is None
+    assert resolver.candidates('') == []
+
+def test_fuzzy_search_returns_every_symbol_of_the_best_name():
+    resolver = StockResolver(ROWS)
+    symbols, matches = resolver.fuzzy_search('台泥 ')
+    assert symbols == ['1101.TW', '8888.TWO']
+    assert matches[0][0] == '台泥'
+    symbols, _ = resolver.fuzzy_search('台積')
+    assert symbols == ['2330.TW']
+
+# 經由資料庫中的股票清單建立的解析器結果相同
+def test_resolver_from_database(tmp_path):
+    db_path = str(tmp_path / 'stock_data.db')
+    stocks = [
+        {'code': code, 'name': name, 'isin': isin, 'date_listed': '2000/01/01', 'market': '上市' if suffix == '.TW' else '上櫃',
+         'industry': '', 'cficode': 'ESVUFR', 'category': '股票', 'suffix': suffix}
+        for code, name, isin, suffix in ROWS
+    ]
+    assert refresh_stock_list(db_path, force=True, fetch=lambda: stocks)
+    assert len(get_resolver(db_path)) == len(ROWS)
+    assert validate_stock_code('台泥', db_path) is None
+    assert stock_candidates('台泥', db_path) == ['1101.TW', '8888.TWO']
+    assert validate_stock_code('環球晶', db_path) == '6488.TWO'
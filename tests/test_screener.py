@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from ta.momentum import RSIIndicator
+
+from stock_tracker.bars import save_bars
+from stock_tracker.config import SCREENER_RSI_WINDOW
+from stock_tracker.db import init_database
+from stock_tracker.providers import synthetic_bars
+from stock_tracker.screener import compute_screen, load_panel, screen
+from stock_tracker.stock_list import refresh_stock_list
+
+# 全市場 RSI 應與 ta 逐檔計算相同（包含上市較晚、前段沒有 K 線的股票）
+@pytest.mark.parametrize('periods', [20, 40, 250])
+def test_screen_rsi_matches_ta(tmp_path, periods):
+    db_path = str(tmp_path / 'stock_data.db')
+    init_database(db_path)
+    bars = {
+        '1101.TW': synthetic_bars('1101.TW', '1d', '2024-10-01', periods, start_price=40.0),
+        '2330.TW': synthetic_bars('2330.TW', '1d', '2024-10-01', periods, start_price=500.0),
+        '6488.TWO': synthetic_bars('6488.TWO', '1d', '2024-10-01', periods - 3, start_price=300.0),
+    }
+    save_bars(db_path, bars, '1d')
+    result = compute_screen(load_panel(db_path))
+    for symbol, data in bars.items():
+        expected = RSIIndicator(data['Close'], window=SCREENER_RSI_WINDOW).rsi().iloc[-1]
+        assert np.isclose(result.at[symbol, f"rsi_{SCREENER_RSI_WINDOW}"], expected, atol=1e-9)
+
+# 當天的日 K 線重新寫入（時間不變、收盤價更新）後，選股結果跟著更新
+def test_screen_refreshes_when_todays_bar_changes(tmp_path):
+    db_path = str(tmp_path / 'stock_data.db')
+    init_database(db_path)
+    refresh_stock_list(db_path, force=True, fetch=lambda: [
+        {'code': '1101', 'name': '台泥', 'isin': '', 'date_listed': '', 'market': '上市', 'industry': '水泥工業', 'cficode': ''},
+    ])
+    bars = synthetic_bars('1101.TW', '1d', '2024-10-01', 30, start_price=40.0)
+    save_bars(db_path, {'1101.TW': bars}, '1d')
+    before = screen(db_path).set_index('symbol').at['1101.TW', 'close']
+    bars.iloc[-1, bars.columns.get_loc('Close')] += 1.0
+    save_bars(db_path, {'1101.TW': bars.iloc[-1:]}, '1d')
+    after = screen(db_path).set_index('symbol').at['1101.TW', 'close']
+    assert np.isclose(after, before + 1.0)
@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from stock_tracker.bars import read_bars
+from stock_tracker.config import MARKET_TZ
+from stock_tracker.db import get_database
+from stock_tracker.snapshots import ingest_snapshots, list_snapshots, parse_snapshot
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'snapshots')
+SYMBOLS = ['0050.TW', '00878.TW', '1101.TW', '2317.TW', '2330.TW']
+
+def fixture(name):
+    return os.path.join(SNAPSHOT_DIR, name)
+
+# Big5 CSV：="0050" 保留代號前面的 0，千分位去除，未成交（--）的股票略過
+def test_parse_big5_csv():
+    quotes = parse_snapshot(fixture('MI_INDEX_20240926.csv'))
+    assert quotes.index.tolist() == SYMBOLS
+    assert '1258.TW' not in quotes.index
+    assert quotes.loc['2330.TW'].tolist() == [1015.49, 1042.89, 997.95, 1025.19, 61551]
+    assert quotes.loc['0050.TW', 'Volume'] == 8123456
+    assert quotes['Volume'].dtype == 'int64'
+
+# MI_INDEX JSON：新版 tables 陣列與舊版 fieldsN / dataN 都找得到個股行情表格
+@pytest.mark.parametrize('name, close', [('MI_INDEX_20240927.json', 1017.62), ('MI_INDEX_20240930.json', 1002.93)])
+def test_parse_mi_index_json(name, close):
+    quotes = parse_snapshot(fixture(name))
+    assert quotes.index.tolist() == SYMBOLS
+    assert quotes.at['2330.TW', 'Close'] == close
+
+# OpenAPI STOCK_DAY_ALL：物件陣列，沒有成交的股票（空白價格）略過
+def test_parse_stock_day_all():
+    quotes = parse_snapshot(fixture('STOCK_DAY_ALL_20241001.json'))
+    assert quotes.index.tolist() == SYMBOLS
+    assert quotes.loc['1101.TW'].tolist() == [36.11, 37.44, 35.12, 36.44, 244029]
+
+# 休市日的回應沒有個股行情表格
+def test_parse_holiday_json():
+    quotes = parse_snapshot(fixture('MI_INDEX_20241002.json'))
+    assert quotes.empty
+    assert list(quotes.columns) == ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# 匯入全部範例檔案：每個交易日一根日 K 線（台股時區 00:00），重新匯入不會重複寫入
+def test_ingest_is_idempotent(tmp_path):
+    directory = tmp_path / 'snapshots'
+    shutil.copytree(SNAPSHOT_DIR, directory)
+    db_path = str(tmp_path / 'stock_data.db')
+    assert sorted(list_snapshots(str(directory))) == ['20240926', '20240927', '20240930', '20241001', '20241002']
+    result = ingest_snapshots(db_path, str(directory))
+    assert result == {'files': 5, 'rows': 20, 'skipped': 0, 'missing': []}
+    bars = read_bars(db_path, '2330.TW', '1d')
+    assert bars.index.tolist() == [pd.Timestamp(day, tz=MARKET_TZ) for day in ('2024-09-26', '2024-09-27', '2024-09-30', '2024-10-01')]
+    assert bars['Close'].tolist() == [1025.19, 1017.62, 1002.93, 1007.30]
+
+    assert ingest_snapshots(db_path, str(directory)) == {'files': 0, 'rows': 0, 'skipped': 5, 'missing': []}
+    # 檔案變更（例如重新下載）時重新匯入，同一天的 K 線以新檔案為準
+    os.utime(directory / 'MI_INDEX_20240926.csv', ns=(0, 0))
+    assert ingest_snapshots(db_path, str(directory))['files'] == 1
+    db = get_database(db_path)
+    assert db.query("SELECT COUNT(*) FROM stock_data WHERE interval = '1d'")[0][0] == 20
+    assert db.query("SELECT COUNT(*) FROM snapshot_files")[0][0] == 5
+    pd.testing.assert_frame_equal(read_bars(db_path, '2330.TW', '1d'), bars)
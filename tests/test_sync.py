@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+from stock_tracker.bars import get_bar_store, read_bars, sync_many
+from stock_tracker.config import MARKET_TZ
+from stock_tracker.db import get_database, init_database
+from stock_tracker.providers import ReplayProvider, default_window, read_replay_bars, replay_path
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'replay')
+SYMBOLS = ['1101.TW', '2330.TW']
+
+# 記錄每次 K 線請求的重播資料來源（clock 控制目前時間）
+class RecordingProvider(ReplayProvider):
+    def __init__(self, now):
+        self.now = pd.Timestamp(now, tz=MARKET_TZ)
+        super().__init__(REPLAY_DIR, clock=lambda: self.now)
+        self.calls = []
+
+    def bars(self, symbols, interval, start=None):
+        self.calls.append((sorted(set(symbols)), interval, start))
+        return super().bars(symbols, interval, start)
+
+def make_db(tmp_path):
+    db_path = str(tmp_path / 'stock_data.db')
+    init_database(db_path)
+    return db_path
+
+def fixture_bars(symbol, interval, until):
+    data = read_replay_bars(replay_path(REPLAY_DIR, symbol, interval))
+    return data[data.index <= pd.Timestamp(until, tz=MARKET_TZ)]
+
+def assert_stored(db_path, symbol, interval, expected):
+    stored = read_bars(db_path, symbol, interval)
+    pd.testing.assert_frame_equal(stored, expected, check_dtype=False, check_freq=False, check_names=False)
+
+# 尚無 K 線的股票以一次批次抓取預設區間（日 K 線為最近一個月）
+def test_cold_sync_stores_default_window(tmp_path):
+    db_path = make_db(tmp_path)
+    provider = RecordingProvider('2024-10-01 14:00')
+    frames = sync_many(db_path, SYMBOLS, '1d', provider)
+    assert provider.calls == [(SYMBOLS, '1d', None)]
+    for symbol in SYMBOLS:
+        expected = default_window(fixture_bars(symbol, '1d', '2024-10-01 14:00'), '1d')
+        assert_stored(db_path, symbol, '1d', expected)
+        pd.testing.assert_frame_equal(frames[symbol], expected, check_dtype=False, check_freq=False)
+
+# 之後的同步只要求最後一根已存 K 線之後的資料，新的 K 線接在後面
+def test_incremental_sync_starts_at_last_bar(tmp_path):
+    db_path = make_db(tmp_path)
+    provider = RecordingProvider('2024-10-01 11:00')
+    first = sync_many(db_path, SYMBOLS, '1m', provider)
+    last_ts = max(frame.index[-1] for frame in first.values())
+    assert last_ts == pd.Timestamp('2024-10-01 11:00', tz=MARKET_TZ)
+    provider.now = pd.Timestamp('2024-10-01 13:29', tz=MARKET_TZ)
+    sync_many(db_path, SYMBOLS, '1m', provider)
+    assert provider.calls[-1] == (SYMBOLS, '1m', last_ts)
+    for symbol in SYMBOLS:
+        assert_stored(db_path, symbol, '1m', fixture_bars(symbol, '1m', '2024-10-01 13:29'))
+    # 沒有新資料時再同步一次不會產生重複的 K 線
+    sync_many(db_path, SYMBOLS, '1m', provider)
+    assert get_database(db_path).query("SELECT COUNT(*) FROM stock_data WHERE interval = '1m'")[0][0] == 2 * 270
+
+# 資料庫中的缺口（同一交易時段內少了 K 線）從缺口起點回補
+def test_gap_is_backfilled(tmp_path):
+    db_path = make_db(tmp_path)
+    provider = RecordingProvider('2024-10-01 13:29')
+    sync_many(db_path, SYMBOLS, '1m', provider)
+    gap_from = pd.Timestamp('2024-10-01 10:00', tz=MARKET_TZ)
+    gap_to = pd.Timestamp('2024-10-01 10:30', tz=MARKET_TZ)
+    with get_database(db_path).transaction() as conn:
+        conn.execute("DELETE FROM stock_data WHERE symbol = ? AND ts BETWEEN ? AND ?",
+                     ('2330.TW', int(gap_from.timestamp()), int(gap_to.timestamp())))
+    # 重新啟動後（記憶體中沒有 K 線）從資料庫載入並找出缺口
+    get_bar_store().invalidate(db_path, '1m')
+    sync_many(db_path, SYMBOLS, '1m', provider)
+    assert provider.calls[-1] == (SYMBOLS, '1m', gap_from - pd.Timedelta(minutes=1))
+    for symbol in SYMBOLS:
+        assert_stored(db_path, symbol, '1m', fixture_bars(symbol, '1m', '2024-10-01 13:29'))